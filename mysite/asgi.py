@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('POLLS_ASYNC_VIEWS', 'True')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from polls.sse import ResultsStreamApplication  # noqa: E402
+
+# Live results streams are served on the event loop, the rest by Django.
+application = ResultsStreamApplication(django_application)
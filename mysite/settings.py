@@ -10,7 +10,8 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 import os
 
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 # optional module to parse database configuration from a single database URL
 
 from pathlib import Path
@@ -50,11 +51,43 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+
+# Opt-in per-view query count and latency instrumentation, exposed in the
+# Server-Timing header and at /polls/_metrics.
+POLLS_INSTRUMENTATION = config('POLLS_INSTRUMENTATION', default=False,
+                               cast=bool)
+if POLLS_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'polls.instrumentation.InstrumentationMiddleware')
+# /polls/_metrics is readable by staff users, and by scrapers sending
+# "Authorization: Bearer <POLLS_METRICS_TOKEN>" when it is set.
+POLLS_METRICS_TOKEN = config('POLLS_METRICS_TOKEN', default='')
+
 AUTHENTICATION_BACKENDS = (
     # username/password authentication
     'django.contrib.auth.backends.ModelBackend',
 )
 
+# SESSION_PROFILE picks where sessions are kept:
+#   db              - the sessions table, one query per request.
+#   cached_db       - the cache, written through to the sessions table.
+#   cache           - only the cache; sessions are lost when it is cleared,
+#                     needs a shared CACHE_BACKEND with several workers.
+#   signed_cookies  - the client's cookie, signed with SECRET_KEY. Sessions
+#                     cannot be revoked server side before they expire.
+SESSION_PROFILE = config('SESSION_PROFILE', default='db')
+SESSION_ENGINE = 'django.contrib.sessions.backends.%s' % SESSION_PROFILE
+
+# Read the logged in user from the cache instead of the auth_user table on
+# every request. Sessions logged in before keep using ModelBackend. Needs a
+# shared CACHE_BACKEND: edits of a user only drop the cached row in the
+# cache they are made on.
+POLLS_CACHED_AUTH = config('POLLS_CACHED_AUTH', default=False, cast=bool)
+POLLS_USER_CACHE_TIMEOUT = config('POLLS_USER_CACHE_TIMEOUT', default=60,
+                                  cast=int)
+if POLLS_CACHED_AUTH:
+    AUTHENTICATION_BACKENDS = ('polls.auth.CachedModelBackend',) + \
+        AUTHENTICATION_BACKENDS
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -78,12 +111,201 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
+# DB_PROFILE selects the database setup:
+#   sqlite        - the development default.
+#   sqlite-tuned  - SQLite for production voting: WAL journal,
+#                   synchronous=NORMAL, memory mapped reads, a busy timeout
+#                   and persistent connections (see polls.db).
+#   postgres      - PostgreSQL with persistent connections. Put PgBouncer in
+#                   transaction mode in front of it for pooling and set
+#                   DB_PGBOUNCER=True, which disables server side cursors.
+
+DB_PROFILE = config('DB_PROFILE', default='sqlite')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='ku_polls'),
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default=''),
+            'PORT': config('DB_PORT', default=''),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+            'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER',
+                                                  default=False, cast=bool),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+
+# Connection settings and the PRAGMAs run on every new connection by
+# polls.db of the SQLite profiles, also compared by benchmark_contention.
+SQLITE_PROFILES = {
+    'sqlite': ({'CONN_MAX_AGE': 0, 'OPTIONS': {}}, {}),
+    'sqlite-tuned': (
+        {
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+            # Seconds a writer waits for the lock before giving up.
+            'OPTIONS': {'timeout': config('SQLITE_BUSY_TIMEOUT', default=20,
+                                          cast=int)},
+        },
+        {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': config('SQLITE_MMAP_SIZE', default=268435456,
+                                cast=int),
+            'temp_store': 'MEMORY',
+        }),
+}
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE in SQLITE_PROFILES:
+    DATABASES['default'].update(SQLITE_PROFILES[DB_PROFILE][0])
+    SQLITE_PRAGMAS = SQLITE_PROFILES[DB_PROFILE][1]
+
+# Read replicas (comma separated aliases) taking the reads of the polls
+# pages. SQLite replicas are the files <alias>.sqlite3, kept in sync
+# locally by `manage.py sync_replicas`; PostgreSQL replicas are read from
+# DB_<ALIAS>_HOST. Replicas not synced within POLLS_REPLICA_MAX_LAG seconds
+# are skipped, and clients that just wrote read from the primary for
+# POLLS_REPLICA_STICKY_SECONDS.
+POLLS_READ_REPLICAS = config('POLLS_READ_REPLICAS', default='', cast=Csv())
+POLLS_REPLICA_MAX_LAG = config('POLLS_REPLICA_MAX_LAG', default=5, cast=int)
+POLLS_REPLICA_STICKY_SECONDS = config('POLLS_REPLICA_STICKY_SECONDS',
+                                      default=15, cast=int)
+
+# Vote shards: the votes of each question live on one of these aliases
+# (comma separated), picked by question id, so hot polls do not share one
+# vote table. POLLS_VOTE_SHARD_PINS gives chosen questions their own alias,
+# e.g. "42:votes_hot". Shards are created like the replicas, run
+# `manage.py migrate --database <alias>` on each and
+# `manage.py rebalance_votes` after changing the placement. Shards taken out
+# of the placement stay in POLLS_VOTE_SHARDS_RETIRED until rebalanced.
+# The vote tables of the shards have no foreign key constraints, their
+# questions, choices and users live in the default database: deletes reach
+# them through the delete_shard_votes signal, not through the ORM cascade.
+POLLS_VOTE_SHARDS = config('POLLS_VOTE_SHARDS', default='', cast=Csv())
+POLLS_VOTE_SHARD_PINS = config(
+    'POLLS_VOTE_SHARD_PINS', default='',
+    cast=Csv(cast=lambda pin: pin.split(':'),
+             post_process=lambda pins: {int(question_id): alias
+                                        for question_id, alias in pins}))
+POLLS_VOTE_SHARDS_RETIRED = config('POLLS_VOTE_SHARDS_RETIRED', default='',
+                                   cast=Csv())
+
+for alias in POLLS_READ_REPLICAS + POLLS_VOTE_SHARDS + \
+        list(POLLS_VOTE_SHARD_PINS.values()) + POLLS_VOTE_SHARDS_RETIRED:
+    DATABASES[alias] = dict(DATABASES['default'])
+    if alias in POLLS_READ_REPLICAS:
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    if DB_PROFILE == 'postgres':
+        DATABASES[alias]['HOST'] = config('DB_%s_HOST' % alias.upper())
+    else:
+        DATABASES[alias]['NAME'] = str(BASE_DIR / ('%s.sqlite3' % alias))
+
+DATABASE_ROUTERS = ['polls.routers.VoteShardRouter',
+                    'polls.routers.ReplicaRouter']
+if POLLS_READ_REPLICAS:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'polls.routers.ReplicaStickinessMiddleware')
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory by default, point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (file, memcached, redis, ...) when running several workers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ku-polls'),
     }
 }
+if POLLS_CACHED_AUTH and \
+        CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+    raise ImproperlyConfigured(
+        'POLLS_CACHED_AUTH needs a CACHE_BACKEND shared by every worker.')
+
+# Seconds the rendered results and the version record (ETag, dates) of a
+# question stay cached. Votes and admin edits invalidate them earlier, in
+# the workers sharing the cache.
+POLLS_RESULTS_CACHE_TIMEOUT = config('POLLS_RESULTS_CACHE_TIMEOUT',
+                                     default=300, cast=int)
+
+# Seconds a question and its choices stay cached for the detail page and
+# the vote checks. Admin edits invalidate the entry earlier.
+POLLS_QUESTION_CACHE_TIMEOUT = config('POLLS_QUESTION_CACHE_TIMEOUT',
+                                      default=3600, cast=int)
+
+# Questions per page of the polls index.
+POLLS_INDEX_PAGE_SIZE = config('POLLS_INDEX_PAGE_SIZE', default=20, cast=int)
+
+# Longest time in seconds an index page or fragment stays cached. Entries
+# expire earlier at the next publication or expiry of a question. The
+# schedule index of each process is rebuilt after the same time.
+POLLS_INDEX_CACHE_TIMEOUT = config('POLLS_INDEX_CACHE_TIMEOUT',
+                                   default=300, cast=int)
+
+# Write-behind vote buffer. When enabled, votes are queued in memory and
+# written in batches every POLLS_VOTE_BUFFER_INTERVAL milliseconds.
+# POLLS_VOTE_BUFFER_DURABILITY is 'memory' (lost on crash), 'journal'
+# (appended to POLLS_VOTE_BUFFER_JOURNAL) or 'fsync' (journal + fsync).
+# Each worker journals to POLLS_VOTE_BUFFER_JOURNAL.<pid>; journals of
+# exited workers are replayed by the next worker started on the host.
+POLLS_VOTE_BUFFER = config('POLLS_VOTE_BUFFER', default=False, cast=bool)
+POLLS_VOTE_BUFFER_INTERVAL = config('POLLS_VOTE_BUFFER_INTERVAL',
+                                    default=200, cast=int)
+POLLS_VOTE_BUFFER_DURABILITY = config('POLLS_VOTE_BUFFER_DURABILITY',
+                                      default='memory')
+POLLS_VOTE_BUFFER_JOURNAL = config('POLLS_VOTE_BUFFER_JOURNAL',
+                                   default=str(BASE_DIR / 'vote-buffer.log'))
+
+# Where the results pages read live vote counts: 'database' (the cached
+# Choice counters) or 'mmap', counters in the memory-mapped
+# POLLS_TALLY_FILE shared by the workers of one host, with one slot for
+# each of the first POLLS_TALLY_SLOTS choice ids. Keep them reconciled with
+# `manage.py reconcile_tallies --interval 60`.
+POLLS_TALLY_BACKEND = config('POLLS_TALLY_BACKEND', default='database')
+POLLS_TALLY_FILE = config('POLLS_TALLY_FILE',
+                          default=str(BASE_DIR / 'vote-tallies.bin'))
+POLLS_TALLY_SLOTS = config('POLLS_TALLY_SLOTS', default=1048576, cast=int)
+
+# Token buckets throttling the vote view, as comma separated
+# scope:votes/seconds, e.g. "user:5/60,ip:30/60,question:200/1" lets a user
+# vote 5 times a minute. Scopes are ip, user and question. Votes over the
+# rate get a 429 with Retry-After. The buckets live in each process with
+# polls.throttle.LocalBucketStore, or in the shared cache with
+# polls.throttle.CacheBucketStore.
+POLLS_VOTE_THROTTLE = config(
+    'POLLS_VOTE_THROTTLE', default='',
+    cast=Csv(cast=lambda rate: rate.split(':'),
+             post_process=lambda rates: {
+                 scope: tuple(float(n) for n in rate.split('/'))
+                 for scope, rate in rates}))
+POLLS_THROTTLE_STORE = config('POLLS_THROTTLE_STORE',
+                              default='polls.throttle.LocalBucketStore')
+# request.META key holding the client IP of the ip scope. Behind a reverse
+# proxy REMOTE_ADDR is the proxy's, use e.g. HTTP_X_FORWARDED_FOR; of a list
+# the last address, added by the proxy, is used.
+POLLS_THROTTLE_IP_HEADER = config('POLLS_THROTTLE_IP_HEADER',
+                                  default='REMOTE_ADDR')
+
+# Route the polls pages to the async views of polls.async_views. Turned on
+# by mysite.asgi, since under WSGI they would only add thread hops.
+POLLS_ASYNC_VIEWS = config('POLLS_ASYNC_VIEWS', default=False, cast=bool)
+
+# Broker carrying tally changes to the live results streams. The default
+# only reaches streams served by the same process.
+POLLS_EVENT_BROKER = config('POLLS_EVENT_BROKER',
+                            default='polls.events.LocalBroker')
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
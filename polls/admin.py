@@ -1,7 +1,36 @@
 """Class for adjust admin web-page."""
 
 from django.contrib import admin
-from .models import Question, Choice
+from django.core.paginator import Paginator
+from django.db.models import OuterRef, Subquery, Sum
+from django.utils.functional import cached_property
+
+from .db import estimated_count
+from .models import Question, Choice, Vote
+from .sharding import vote_databases
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator estimating the size of huge unfiltered tables.
+
+    Counting every row of a big table takes longer than showing one page,
+    so the count of an unfiltered list is estimated, see ``estimated_count``.
+    Filtered lists, small tables and databases without an estimate are
+    counted exactly.
+    """
+
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        """Return the exact or estimated number of objects."""
+        if self.object_list.query.where:
+            return super().count
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < self.exact_below:
+            return super().count
+        return estimate
 
 
 class ChoiceInline(admin.StackedInline):
@@ -9,6 +38,8 @@ class ChoiceInline(admin.StackedInline):
 
     model = Choice
     extra = 3
+    fields = ('choice_text', 'vote_count')
+    readonly_fields = ('vote_count',)
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -21,9 +52,104 @@ class QuestionAdmin(admin.ModelAdmin):
     ]
     inlines = [ChoiceInline]
     list_display = ('question_text', 'pub_date',
-                    'end_date', 'was_published_recently')
+                    'end_date', 'was_published_recently', 'total_votes')
     list_filter = ['pub_date']
     search_fields = ['question_text']
+    paginator = EstimatedCountPaginator
+    # Searches skip the second COUNT(*) of the whole table.
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """
+        Annotate each question with its votes, from the counters.
+
+        The sum is a correlated subquery rather than a join with GROUP BY,
+        so counting and searching the list stays a plain table query.
+        """
+        totals = Choice.objects.filter(question=OuterRef('pk')).order_by() \
+            .values('question').annotate(total=Sum('vote_count')) \
+            .values('total')
+        return super().get_queryset(request).annotate(
+            total_votes=Subquery(totals))
+
+    def total_votes(self, question):
+        """Return the number of votes of a question."""
+        return question.total_votes or 0
+
+    total_votes.admin_order_field = 'total_votes'
+    total_votes.short_description = 'Votes'
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Class for picking the vote shard listed in admin page."""
+
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        """Offer every database holding votes."""
+        return [(alias, alias) for alias in vote_databases()]
+
+    def queryset(self, request, queryset):
+        """Leave the database to ``VoteAdmin.get_queryset``."""
+        return queryset
+
+    def choices(self, changelist):
+        """List the shards without an "All" entry, one shard at a time."""
+        current = self.value() or vote_databases()[0]
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': current == lookup,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """Class for listing the votes of one shard in admin page."""
+
+    list_display = ('question', 'choice', 'user')
+    # Vote ids repeat across shards, so rows do not link to a change page.
+    list_display_links = None
+    list_filter = [ShardListFilter]
+    list_select_related = ('question', 'choice', 'user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """
+        Return the votes of the shard picked in the filter.
+
+        The questions, choices and users of votes on a shard are in the
+        default database, so they are prefetched from there instead of
+        joined.
+        """
+        alias = self.shard(request)
+        queryset = super().get_queryset(request).using(alias)
+        if alias != vote_databases()[0]:
+            queryset = queryset.prefetch_related(*self.list_select_related)
+        return queryset
+
+    def get_list_select_related(self, request):
+        """Join the related rows, unless they live in another database."""
+        if self.shard(request) == vote_databases()[0]:
+            return self.list_select_related
+        return ()
+
+    def shard(self, request):
+        """Return the shard picked in the filter."""
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        return alias if alias in vote_databases() else vote_databases()[0]
+
+    def has_add_permission(self, request):
+        """Votes are cast through the polls, not added here."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Votes are cast through the polls, not edited here."""
+        return False
 
 
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(Vote, VoteAdmin)
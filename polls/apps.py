@@ -7,3 +7,12 @@ class PollsConfig(AppConfig):
     """Class contain app config."""
 
     name = 'polls'
+
+    def ready(self):
+        """Connect the signal handlers of the app."""
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import apply_sqlite_pragmas
+
+        connection_created.connect(apply_sqlite_pragmas)
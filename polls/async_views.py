@@ -0,0 +1,131 @@
+"""
+Async views of Django polls app, served when running under ASGI.
+
+They mirror the views of ``polls.views`` but run on the event loop. The
+ORM, the cache and the template engine are synchronous in the Django
+versions we support, so every use of them crosses an explicit
+``sync_to_async`` boundary; ORM reads use the async query methods instead
+when the installed Django has them. The index stays on the sync
+``IndexView``, it is mostly served from the page cache.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import views
+from .buffer import get_buffer
+from .cache import get_question_graph, get_results, question_version
+from .models import Question
+from .schedule import get_schedule_with
+from .throttle import throttle_votes
+from .voting import cast_vote, holds_vote
+
+
+async def results(request, pk):
+    """Async version of ``ResultsView``."""
+    version = await sync_to_async(question_version)(pk)
+    if version is None:
+        raise Http404('No question found.')
+    etag = views.version_etag('results', version)
+    response = _not_modified(request, etag, version)
+    if response is not None:
+        return response
+    question = await _aget(Question.objects.select_related('snapshot'), pk=pk)
+    choices = await sync_to_async(get_results)(question)
+    response = await sync_to_async(render)(request, 'polls/results.html', {
+        'object': question, 'question': question, 'choices': choices,
+        'live_results': settings.POLLS_ASYNC_VIEWS})
+    return _with_validators(response, etag, version)
+
+
+async def polls_check_expire(request, question_id):
+    """Async version of ``polls_check_expire``."""
+    version = await sync_to_async(question_version)(question_id)
+    if version is None:
+        raise Http404('No question found.')
+    if not views.is_open(version):
+        await sync_to_async(messages.warning)(
+            request, "Poll expired!, please choose another question")
+        return redirect('polls:index')
+    question, choices = await _question_graph(question_id)
+    return await sync_to_async(render)(request, 'polls/detail.html', {
+        'question': question, 'choices': choices})
+
+
+@throttle_votes
+async def vote(request, question_id):
+    """Async version of ``vote``."""
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    schedule = await sync_to_async(get_schedule_with)(question_id)
+    if question_id not in schedule:
+        raise Http404('No question found.')
+    if not schedule.is_open(question_id):
+        await sync_to_async(messages.warning)(
+            request, "Poll expired!, please choose another question")
+        return redirect('polls:index')
+    question, choices = await _question_graph(question_id)
+    selected_choice = views.selected(choices, request.POST.get('choice'))
+    if selected_choice is None:
+        return await sync_to_async(render)(request, 'polls/detail.html', {
+            'question': question,
+            'choices': choices,
+            'error_message': "You didn't select a choice.",
+        })
+    buffer = get_buffer()
+    if buffer is not None:
+        await sync_to_async(buffer.add)(user.pk, question.pk,
+                                        selected_choice.pk)
+    elif not await sync_to_async(holds_vote)(user.pk, question.pk,
+                                             selected_choice.pk):
+        await sync_to_async(cast_vote)(user, question, selected_choice)
+    return HttpResponseRedirect(reverse('polls:results',
+                                        args=(question.id,)))
+
+
+async def _question_graph(question_id):
+    """Return the cached question and choices, or raise 404."""
+    graph = await sync_to_async(get_question_graph)(question_id)
+    if graph is None:
+        raise Http404('No question found.')
+    return graph
+
+
+async def _aget(queryset, **lookup):
+    """
+    Return ``queryset.get(**lookup)`` without blocking the event loop.
+
+    Raise ``Http404`` for a missing question, like ``get_object_or_404``.
+    """
+    try:
+        if hasattr(queryset, 'aget'):
+            return await queryset.aget(**lookup)
+        return await sync_to_async(queryset.get)(**lookup)
+    except Question.DoesNotExist:
+        raise Http404('No question found.')
+
+
+def _authenticated_user(request):
+    """Return the logged in user of `request`, or None."""
+    return request.user if request.user.is_authenticated else None
+
+
+def _not_modified(request, etag, version):
+    """Return a 304/412 response when the client's copy is current."""
+    return get_conditional_response(
+        request, etag=quote_etag(etag),
+        last_modified=int(version['modified'].timestamp()))
+
+
+def _with_validators(response, etag, version):
+    """Add the ETag and Last-Modified headers to `response`."""
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(version['modified'].timestamp())
+    return response
@@ -0,0 +1,34 @@
+"""Authentication backend for Django polls application."""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_KEY = 'polls:user:%s'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` reading the user of a session from the cache.
+
+    The user row is read once and cached for ``POLLS_USER_CACHE_TIMEOUT``
+    seconds. Saving or deleting the user drops it from the cache, so with
+    a cache shared by every worker password changes and deactivations
+    take effect at once. Changes that skip the model signals, such as
+    ``QuerySet.update()``, only show once the entry expires; call
+    ``invalidate_user`` after them.
+    """
+
+    def get_user(self, user_id):
+        """Return the active user with `user_id`, or None."""
+        key = USER_KEY % user_id
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.POLLS_USER_CACHE_TIMEOUT)
+        return user
+
+
+def invalidate_user(user_id):
+    """Drop the cached user row of `user_id`."""
+    cache.delete(USER_KEY % user_id)
@@ -0,0 +1,300 @@
+"""Seeding, load generation and reporting helpers for the polls benchmarks."""
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from types import ModuleType
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from .models import Choice, Question, Vote
+from .schedule import get_schedule, reload_schedules
+from .sharding import shard_for_question, vote_databases
+
+# Password of every seeded user.
+BENCH_PASSWORD = 'benchmark'
+
+
+@contextmanager
+def benchmark_database(name='bench.db'):
+    """
+    Run the block against a fresh, migrated test database.
+
+    With SQLite the database is a temporary file rather than the in-memory
+    test database, so that the load generator threads share its data.
+    Vote shards get a test database of their own.
+    """
+    aliases = vote_databases()
+    with tempfile.TemporaryDirectory() as directory:
+        for alias in aliases:
+            if connections[alias].vendor == 'sqlite':
+                connections[alias].settings_dict.setdefault('TEST', {})[
+                    'NAME'] = os.path.join(directory, '%s-%s' % (alias, name))
+        databases = setup_databases(verbosity=0, interactive=False,
+                                    aliases=set(aliases))
+        try:
+            yield
+        finally:
+            connections.close_all()
+            teardown_databases(databases, verbosity=0)
+
+
+def seed_users(count, batch_size=1000):
+    """Create `count` users sharing ``BENCH_PASSWORD``, return their ids."""
+    prefix = 'bench-%s-' % uuid.uuid4().hex[:8]
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create(
+        (User(username='%s%d' % (prefix, n), password=password)
+         for n in range(count)), batch_size=batch_size)
+    return list(User.objects.filter(username__startswith=prefix)
+                .order_by('pk').values_list('pk', flat=True))
+
+
+def seed_questions(count, choices=4, closed=0.1, rng=None, batch_size=1000):
+    """
+    Create `count` questions with `choices` choices each.
+
+    Questions are published over the last days; a `closed` fraction of
+    them has already expired, the others are open for a week. Return a
+    dict mapping each question id to the list of its choice ids.
+    """
+    rng = rng or random.Random()
+    prefix = 'Benchmark %s' % uuid.uuid4().hex[:8]
+    now = timezone.now()
+    questions = []
+    for n in range(count):
+        pub_date = now - datetime.timedelta(minutes=rng.randint(1, 10000))
+        end_date = now - datetime.timedelta(seconds=1) \
+            if rng.random() < closed else now + datetime.timedelta(days=7)
+        questions.append(Question(question_text='%s #%d?' % (prefix, n),
+                                  pub_date=pub_date, end_date=end_date))
+    Question.objects.bulk_create(questions, batch_size=batch_size)
+    reload_schedules()
+    question_ids = list(Question.objects.filter(
+        question_text__startswith=prefix).values_list('pk', flat=True))
+    Choice.objects.bulk_create(
+        (Choice(question_id=question_id, choice_text='Choice %d' % n)
+         for question_id in question_ids for n in range(choices)),
+        batch_size=batch_size)
+    graph = {question_id: [] for question_id in question_ids}
+    for choice_id, question_id in Choice.objects.filter(
+            question__question_text__startswith=prefix) \
+            .order_by('pk').values_list('pk', 'question_id'):
+        graph[question_id].append(choice_id)
+    return graph
+
+
+def seed_votes(graph, user_ids, count, rng=None, batch_size=1000):
+    """
+    Create `count` random votes of `user_ids` on the questions of `graph`.
+
+    Each user votes at most once per question, like through the views,
+    and the choice counters are set to match. Return the votes created.
+    """
+    rng = rng or random.Random()
+    question_ids = list(graph)
+    pairs = len(question_ids) * len(user_ids)
+    count = min(count, pairs)
+    tallies = Counter()
+    shards = defaultdict(list)
+    for position in rng.sample(range(pairs), count):
+        question_id = question_ids[position // len(user_ids)]
+        choice_id = rng.choice(graph[question_id])
+        tallies[choice_id] += 1
+        shards[shard_for_question(question_id)].append(Vote(
+            question_id=question_id, choice_id=choice_id,
+            user_id=user_ids[position % len(user_ids)]))
+    for alias, votes in shards.items():
+        Vote.objects.using(alias).bulk_create(votes, batch_size=batch_size)
+    Choice.objects.bulk_update(
+        [Choice(pk=choice_id, vote_count=total)
+         for choice_id, total in tallies.items()],
+        ['vote_count'], batch_size=batch_size)
+    return count
+
+
+def seed(questions=100, choices=4, users=1000, votes=10000, seed=None):
+    """Seed a benchmark data set, return its question graph and users."""
+    rng = random.Random(seed)
+    user_ids = seed_users(users)
+    graph = seed_questions(questions, choices, rng=rng)
+    seed_votes(graph, user_ids, votes, rng=rng)
+    return graph, user_ids
+
+
+def hot_paths(graph, user_ids, rng=None):
+    """
+    Return the polls hot paths as ``{name: (needs_login, request)}``.
+
+    ``request(client)`` sends one request to a random open question with
+    the given test client and returns the response.
+    """
+    rng = rng or random.Random()
+    schedule = get_schedule()
+    open_ids = [pk for pk in graph if schedule.is_open(pk)]
+
+    def detail(client):
+        url = reverse('polls:detail', args=(rng.choice(open_ids),))
+        return client.get(url)
+
+    def results(client):
+        url = reverse('polls:results', args=(rng.choice(list(graph)),))
+        return client.get(url)
+
+    def vote(client):
+        question_id = rng.choice(open_ids)
+        return client.post(reverse('polls:vote', args=(question_id,)),
+                           {'choice': rng.choice(graph[question_id])})
+
+    return {
+        'index': (False, lambda client: client.get(reverse('polls:index'))),
+        'detail': (False, detail),
+        'results': (False, results),
+        'vote': (True, vote),
+    }
+
+
+def count_queries(send):
+    """Return the number of SQL queries run by `send()`."""
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        send()
+    return queries[0]
+
+
+def run_sequential(send, total):
+    """Run `total` requests one after another and summarize them."""
+    latencies, statuses = [], []
+    start = time.perf_counter()
+    for _ in range(total):
+        request_start = time.perf_counter()
+        statuses.append(send())
+        latencies.append(time.perf_counter() - request_start)
+    return summarize(latencies, time.perf_counter() - start, statuses)
+
+
+def user_logins(user_ids):
+    """Return a thread safe source of the users to log benchmark clients in."""
+    users = itertools.cycle(user_ids)
+    lock = threading.Lock()
+
+    def next_user():
+        with lock:
+            user_id = next(users)
+        return User.objects.get(pk=user_id)
+    return next_user
+
+
+def percentile(ordered, fraction):
+    """Return the `fraction` percentile of the sorted list `ordered`."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, elapsed, statuses):
+    """Return the report of a run: throughput, latencies (ms), statuses."""
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'seconds': round(elapsed, 3),
+        'req_per_sec': round(len(ordered) / elapsed, 1) if elapsed else 0,
+        'mean_ms': round(1000 * sum(ordered) / len(ordered), 3)
+        if ordered else 0,
+        'p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+        'p90_ms': round(1000 * percentile(ordered, 0.90), 3),
+        'p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+        'max_ms': round(1000 * ordered[-1], 3) if ordered else 0,
+        'statuses': dict(Counter(statuses)),
+    }
+
+
+def run_threaded(make_worker, total, concurrency):
+    """
+    Run `total` requests on `concurrency` threads and summarize them.
+
+    ``make_worker()`` is called once per thread and returns the callable
+    sending one request and returning its status code.
+    """
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def work():
+        send = make_worker()
+        try:
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                status = send()
+                latency = time.perf_counter() - start
+                with lock:
+                    latencies.append(latency)
+                    statuses.append(status)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, statuses)
+
+
+async def run_concurrent(make_worker, total, concurrency):
+    """
+    Run `total` requests as `concurrency` tasks and summarize them.
+
+    ``make_worker()`` is called once per task and returns the coroutine
+    function sending one request and returning its status code.
+    """
+    latencies, statuses = [], []
+    remaining = [total]
+
+    async def work():
+        send = make_worker()
+        while remaining[0]:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            status = await send()
+            latencies.append(time.perf_counter() - start)
+            statuses.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(work() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, statuses)
+
+
+def polls_urlconf(use_async_views):
+    """Return a root URLconf serving the sync or the async polls views."""
+    from polls.urls import build_urlpatterns
+
+    urlconf = ModuleType('polls_bench_urls_%s' % use_async_views)
+    urlconf.urlpatterns = [
+        path('polls/', include((build_urlpatterns(use_async_views),
+                                'polls'))),
+        path('accounts/', include('django.contrib.auth.urls')),
+    ]
+    return urlconf
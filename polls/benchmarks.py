@@ -0,0 +1,76 @@
+"""
+Benchmark suite for the hot paths of Django polls application.
+
+It is not collected by the default test run. Run it with
+``python manage.py test polls.benchmarks`` and set POLLS_BENCHMARK_OUTPUT
+to a file name to keep the measurements as JSON. Every benchmark also
+fails when its endpoint exceeds its query budget.
+"""
+import json
+import os
+import random
+
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+
+from .bench import count_queries, hot_paths, run_sequential, seed
+
+
+class HotPathBenchmarks(TestCase):
+    """Measure the index, detail, results and vote endpoints."""
+
+    rounds = 100
+    query_budgets = {'index': 2, 'detail': 3, 'results': 3, 'vote': 10}
+
+    @classmethod
+    def setUpClass(cls):
+        """Collect the measurements of the whole class."""
+        super().setUpClass()
+        cls.measurements = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        """Write the measurements when POLLS_BENCHMARK_OUTPUT is set."""
+        output = os.environ.get('POLLS_BENCHMARK_OUTPUT')
+        if output:
+            with open(output, 'w') as report_file:
+                json.dump(cls.measurements, report_file, indent=2)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed a small data set shared by the benchmarks."""
+        cls.graph, cls.user_ids = seed(questions=50, choices=4, users=50,
+                                       votes=1000, seed=0)
+
+    def benchmark(self, name):
+        """Check the query budget of an endpoint and time it."""
+        login, send = hot_paths(self.graph, self.user_ids,
+                                random.Random(0))[name]
+        client = Client()
+        if login:
+            client.force_login(User.objects.get(pk=self.user_ids[0]))
+
+        def worker():
+            return send(client).status_code
+
+        queries = count_queries(worker)
+        self.assertLessEqual(queries, self.query_budgets[name])
+        self.measurements[name] = dict(run_sequential(worker, self.rounds),
+                                       queries=queries)
+
+    def test_index(self):
+        """Benchmark the index page."""
+        self.benchmark('index')
+
+    def test_detail(self):
+        """Benchmark the detail page."""
+        self.benchmark('detail')
+
+    def test_results(self):
+        """Benchmark the results page."""
+        self.benchmark('results')
+
+    def test_vote(self):
+        """Benchmark voting."""
+        self.benchmark('vote')
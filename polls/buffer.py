@@ -0,0 +1,283 @@
+"""Write-behind buffer for votes in Django polls application."""
+import atexit
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+MEMORY = 'memory'
+JOURNAL = 'journal'
+FSYNC = 'fsync'
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class VoteBuffer:
+    """
+    Coalesce submitted votes in memory and write them in periodic batches.
+
+    Ballots are kept last-write-wins per ``(user, question)`` and flushed
+    every `interval` seconds through ``cast_votes_bulk`` by a background
+    thread. With the ``journal`` or ``fsync`` durability every ballot is
+    also appended to a journal (fsynced with ``fsync``) so that votes not
+    flushed yet survive a crash and are replayed on the next start. Each
+    process journals to `journal_path` suffixed with its pid; the journals
+    left by processes that exited are replayed by the next buffer started
+    on the host. Ballots of unknown users or for invalid choices are
+    logged and counted in ``dropped``.
+    """
+
+    def __init__(self, interval=0.2, durability=MEMORY, journal_path=None):
+        """Create an empty buffer, replaying the journal when there is one."""
+        if durability not in (MEMORY, JOURNAL, FSYNC):
+            raise ValueError('Unknown durability %r.' % durability)
+        if durability != MEMORY and not journal_path:
+            raise ValueError('A journal path is needed for %r.' % durability)
+        self.interval = interval
+        self.durability = durability
+        self.journal_base = journal_path
+        self.journal_path = journal_path and '%s.%d' % (journal_path,
+                                                        os.getpid())
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._journal = None
+        self.dropped = 0
+        if durability != MEMORY:
+            self._recover()
+
+    def add(self, user_id, question_id, choice_id):
+        """Queue a ballot, replacing a pending one of the same user."""
+        from .cache import touch_question
+
+        with self._lock:
+            self._pending[user_id, question_id] = choice_id
+            if self._journal is not None:
+                self._journal.write('%d,%d,%d\n' % (user_id, question_id,
+                                                    choice_id))
+                self._journal.flush()
+                if self.durability == FSYNC:
+                    os.fsync(self._journal.fileno())
+        touch_question(question_id)
+
+    def pending_for(self, question_id):
+        """Return ``{user_id: choice_id}`` of the ballots not written yet."""
+        with self._lock:
+            return {user_id: choice_id
+                    for (user_id, pending_question), choice_id
+                    in self._pending.items()
+                    if pending_question == question_id}
+
+    def overlay(self, question_id, results):
+        """
+        Return the tally rows `results` with the pending ballots applied.
+
+        A pending ballot counts for its choice and no longer for the choice
+        the user holds in the database, so voters see their vote at once.
+        """
+        pending = self.pending_for(question_id)
+        if not pending:
+            return results
+        deltas = dict.fromkeys(pending.values(), 0)
+        for choice_id in pending.values():
+            deltas[choice_id] += 1
+        for choice_id in Vote.objects.for_question(question_id) \
+                .filter(user__in=list(pending)) \
+                .values_list('choice', flat=True):
+            deltas[choice_id] = deltas.get(choice_id, 0) - 1
+        return [dict(row, votes=row['votes'] + deltas.get(row['id'], 0))
+                for row in results]
+
+    def flush(self):
+        """Write the pending ballots to the database, return how many."""
+        from .voting import INVALID_CHOICE, UNKNOWN_USER, cast_votes_bulk
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                if self._journal is not None:
+                    self._journal.close()
+                    os.replace(self.journal_path,
+                               self.journal_path + '.flushing')
+                    self._journal = open(self.journal_path, 'a')
+            try:
+                outcomes = cast_votes_bulk([
+                    (user_id, question_id, choice_id)
+                    for (user_id, question_id), choice_id in batch.items()])
+            except Exception:
+                logger.exception('Could not flush %d buffered votes.',
+                                 len(batch))
+                with self._lock:
+                    for key, choice_id in batch.items():
+                        self._pending.setdefault(key, choice_id)
+                    if self._journal is not None:
+                        self._restore_journal(batch)
+                raise
+            if self._journal is not None:
+                os.remove(self.journal_path + '.flushing')
+            rejected = Counter(outcome for outcome in outcomes
+                               if outcome in (UNKNOWN_USER, INVALID_CHOICE))
+            if rejected:
+                self.dropped += sum(rejected.values())
+                logger.warning(
+                    'Dropped buffered votes: %d of unknown users, %d for '
+                    'invalid choices.', rejected[UNKNOWN_USER],
+                    rejected[INVALID_CHOICE])
+            return len(batch)
+
+    def _restore_journal(self, batch):
+        """
+        Put the ballots of a failed flush back at the head of the journal.
+
+        They go before the ballots journaled since, so that a replay
+        keeps the newer ballot of a user, like the pending ballots do. The
+        journal is replaced atomically and ``.flushing`` only removed
+        afterwards, so a crash in between still replays both in order.
+        """
+        self._journal.close()
+        with open(self.journal_path) as journal:
+            newer = journal.read()
+        restored = self.journal_path + '.restore'
+        with open(restored, 'w') as journal:
+            for key, choice_id in batch.items():
+                journal.write('%d,%d,%d\n' % (key + (choice_id,)))
+            journal.write(newer)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(restored, self.journal_path)
+        os.remove(self.journal_path + '.flushing')
+        self._journal = open(self.journal_path, 'a')
+
+    def start(self):
+        """Start the background flusher thread."""
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='polls-vote-buffer')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and drain the pending ballots."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _run(self):
+        """Flush the buffer every interval until stopped."""
+        from django.db import connection
+
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass  # Already logged, the ballots are retried next time.
+        connection.close()
+
+    def _recover(self):
+        """
+        Reload the journaled ballots not written yet and reopen the journal.
+
+        They are those of a previous run with this pid and those of exited
+        processes, whose journals are claimed by renaming them first so that
+        a single process replays them.
+        """
+        paths = self._claim_journals()
+        for path in paths:
+            with open(path) as journal:
+                for line in journal:
+                    try:
+                        user_id, question_id, choice_id = map(
+                            int, line.split(','))
+                    except ValueError:
+                        continue  # Torn last line of a crashed process.
+                    self._pending[user_id, question_id] = choice_id
+        self._journal = open(self.journal_path, 'w')
+        for key, choice_id in self._pending.items():
+            self._journal.write('%d,%d,%d\n' % (key + (choice_id,)))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        for path in paths:
+            if path != self.journal_path:
+                os.remove(path)
+
+    def _claim_journals(self):
+        """Return the journal files to replay, oldest ballots first."""
+        directory, name = os.path.split(self.journal_base)
+        pattern = re.compile(r'^%s\.(\d+)(\.adopted\w+|\.flushing)?$'
+                             % re.escape(name))
+        found = []
+        for entry in os.listdir(directory or '.'):
+            match = pattern.match(entry)
+            if match is None:
+                continue
+            pid, suffix = int(match.group(1)), match.group(2) or ''
+            if pid != os.getpid() and _is_running(pid):
+                continue
+            rank = 2 if not suffix else 1 if suffix == '.flushing' else 0
+            found.append((pid, rank, os.path.join(directory, entry)))
+        paths = []
+        for pid, _, path in sorted(found):
+            if pid != os.getpid():
+                claimed = '%s.adopted%s' % (self.journal_path,
+                                            uuid.uuid4().hex)
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue  # Claimed by another process.
+                path = claimed
+            paths.append(path)
+        return paths
+
+
+def _is_running(pid):
+    """
+    Return whether process `pid` is running on this host.
+
+    On Windows, where this cannot be asked without side effects, every
+    process is taken as running: journals of exited processes are kept.
+    """
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_buffer():
+    """
+    Return the process vote buffer, or None when buffering is disabled.
+
+    The buffer and its flusher thread are created on first use and the
+    pending ballots are drained when the interpreter exits.
+    """
+    global _buffer
+    if not settings.POLLS_VOTE_BUFFER:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(
+                interval=settings.POLLS_VOTE_BUFFER_INTERVAL / 1000,
+                durability=settings.POLLS_VOTE_BUFFER_DURABILITY,
+                journal_path=str(settings.POLLS_VOTE_BUFFER_JOURNAL))
+            _buffer.start()
+            atexit.register(_buffer.stop)
+        return _buffer
@@ -0,0 +1,238 @@
+"""Cached read paths for Django polls application."""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .buffer import get_buffer
+from .models import Choice, Question, ResultSnapshot
+from .routers import use_primary
+from .tallies import get_tallies
+
+RESULTS_KEY = 'polls:results:%d'
+INDEX_VERSION_KEY = 'polls:index:version'
+INDEX_PAGE_KEY = 'polls:index:page:%s:%s'
+QUESTION_VERSION_KEY = 'polls:question:%d:version'
+QUESTION_GRAPH_KEY = 'polls:question:%d:graph'
+
+
+def get_results(question, pending=True):
+    """
+    Return the tally rows shown on the results page of `question`.
+
+    Each row is a dict with the ``id``, ``choice_text``, ``votes`` and
+    ``percent`` of one choice. Rows are served from the cache and only read
+    from the primary database after a vote or an edit invalidated them.
+    Votes still waiting in the write-behind buffer are counted too, unless
+    `pending` is false. With the ``mmap`` tally backend the votes are read
+    from the shared counters and the choices from the question graph cache
+    instead.
+    Closed questions are served from their ``ResultSnapshot``, taken on the
+    first request after ``end_date``; load them with
+    ``select_related('snapshot')`` to get it with the question.
+    """
+    if question.end_date < timezone.now():
+        try:
+            return question.snapshot.results
+        except ResultSnapshot.DoesNotExist:
+            return snapshot_results(question).results
+    results = _shared_results(question.pk)
+    if results is None:
+        results = _counter_results(question)
+    buffer = get_buffer()
+    if buffer is not None and pending:
+        results = buffer.overlay(question.pk, results)
+    return _with_percentages(results)
+
+
+def _counter_results(question):
+    """Return the tally rows of the Choice counters, cached."""
+    key = RESULTS_KEY % question.pk
+    results = cache.get(key)
+    if results is None:
+        with use_primary():
+            results = [
+                {'id': pk, 'choice_text': text, 'votes': votes}
+                for pk, text, votes in question.choice_set.order_by('pk')
+                .values_list('pk', 'choice_text', 'vote_count')
+            ]
+        cache.set(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+def _shared_results(question_id):
+    """Return the tally rows from the shared counters, None if unusable."""
+    tallies = get_tallies()
+    graph = tallies and get_question_graph(question_id)
+    if not graph:
+        return None
+    choices = graph[1]
+    counts = tallies.counts([choice.pk for choice in choices])
+    if counts is None:
+        return None
+    return [{'id': choice.pk, 'choice_text': choice.choice_text,
+             'votes': counts[choice.pk]} for choice in choices]
+
+
+def snapshot_results(question):
+    """
+    Freeze the results of a closed question, return its ``ResultSnapshot``.
+
+    The votes are counted from the Vote rows rather than the counters.
+    When another request froze them first, its snapshot is returned.
+    """
+    with use_primary():
+        results = _with_percentages([
+            {'id': choice.pk, 'choice_text': choice.choice_text,
+             'votes': choice.votes}
+            for choice in question.choices_with_votes()
+        ])
+    snapshot, _ = ResultSnapshot.objects.get_or_create(
+        question=question, defaults={
+            'results': results,
+            'total_votes': sum(row['votes'] for row in results)})
+    question.snapshot = snapshot
+    return snapshot
+
+
+def drop_snapshots(question_ids):
+    """Drop the snapshots of questions whose votes or choices changed."""
+    ResultSnapshot.objects.filter(question__in=question_ids).delete()
+
+
+def _with_percentages(results):
+    """Return the tally rows with each choice's share of the votes."""
+    total = sum(row['votes'] for row in results)
+    return [dict(row, percent=round(100.0 * row['votes'] / total, 1)
+                 if total else 0.0) for row in results]
+
+
+def invalidate_results(question_id):
+    """Drop the cached results of one question and bump its version."""
+    cache.delete_many([RESULTS_KEY % question_id,
+                       QUESTION_VERSION_KEY % question_id])
+
+
+def get_question_graph(question_id):
+    """
+    Return a question and the list of its choices, or None if missing.
+
+    The question is read with its choices once and cached as a compact
+    tuple of their fields until an edit invalidates it, so the detail
+    page and the choice check of a vote do not touch the database. Vote
+    counters are left out and deferred, they change with every vote.
+    """
+    key = QUESTION_GRAPH_KEY % question_id
+    graph = cache.get(key)
+    if graph is None:
+        with use_primary():
+            question = Question.objects.filter(pk=question_id) \
+                .prefetch_related('choice_set').first()
+        if question is None:
+            return None
+        graph = (question.question_text, question.pub_date,
+                 question.end_date,
+                 tuple(sorted((choice.pk, choice.choice_text)
+                              for choice in question.choice_set.all())))
+        cache.set(key, graph, settings.POLLS_QUESTION_CACHE_TIMEOUT)
+    question_text, pub_date, end_date, choices = graph
+    question = Question(pk=question_id, question_text=question_text,
+                        pub_date=pub_date, end_date=end_date)
+    question._state.adding = False
+    return question, [_cached_choice(question, pk, text)
+                      for pk, text in choices]
+
+
+def _cached_choice(question, pk, choice_text):
+    """
+    Return a choice of `question` loaded from its cached fields.
+
+    ``vote_count`` is left deferred: reading it queries the database and
+    saving the choice only writes the cached fields, not a stale counter.
+    """
+    choice = Choice.from_db('default', ['id', 'question_id', 'choice_text'],
+                            [pk, question.pk, choice_text])
+    choice.question = question
+    return choice
+
+
+def invalidate_question(question_id):
+    """Drop the cached question graph of an edited question or choice."""
+    cache.delete(QUESTION_GRAPH_KEY % question_id)
+
+
+def question_version(question_id):
+    """
+    Return the cached version record of a question, or None if missing.
+
+    The record holds an ``etag`` that changes with every vote or edit of
+    the question, the ``modified`` time of that change and the question's
+    ``pub_date`` and ``end_date``. It answers conditional requests without
+    touching the database except when it has to be created. Like the
+    results it expires after ``POLLS_RESULTS_CACHE_TIMEOUT`` seconds, so
+    workers that do not share the cache see edits made elsewhere.
+    """
+    key = QUESTION_VERSION_KEY % question_id
+    version = cache.get(key)
+    if version is None:
+        with use_primary():
+            dates = Question.objects.filter(pk=question_id) \
+                .values_list('pub_date', 'end_date').first()
+        if dates is None:
+            return None
+        cache.add(key, {
+            'etag': uuid.uuid4().hex,
+            'modified': timezone.now().replace(microsecond=0),
+            'pub_date': dates[0],
+            'end_date': dates[1],
+        }, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def touch_question(question_id):
+    """Bump the version of a question whose results changed."""
+    cache.delete(QUESTION_VERSION_KEY % question_id)
+
+
+def index_version():
+    """
+    Return the version of the question list that index caches are keyed on.
+
+    Invalidating the index drops the version; the next reader installs a
+    fresh one, which orphans every page and fragment cached under the old.
+    """
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(INDEX_VERSION_KEY)
+    return version
+
+
+def invalidate_index():
+    """Drop every cached index page and fragment."""
+    cache.delete(INDEX_VERSION_KEY)
+
+
+def index_page_key(cursor):
+    """Return the cache key of the anonymous index page at `cursor`."""
+    digest = hashlib.md5(cursor.encode()).hexdigest()
+    return INDEX_PAGE_KEY % (index_version(), digest)
+
+
+def index_cache_timeout(now=None):
+    """
+    Return how long an index page may be cached, in whole seconds.
+
+    Pages expire no later than the next time a question opens or closes.
+    """
+    from .schedule import get_schedule
+
+    now = now or timezone.now()
+    timeout = settings.POLLS_INDEX_CACHE_TIMEOUT
+    at = get_schedule().next_transition(now)
+    if at is not None:
+        timeout = min(timeout, int((at - now).total_seconds()))
+    return max(timeout, 0)
@@ -0,0 +1,42 @@
+"""Database connection setup and helpers for Django polls application."""
+import re
+
+from django.conf import settings
+from django.db import connections
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the ``SQLITE_PRAGMAS`` setting on a new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not PRAGMA_NAME.match(name) or \
+                    not PRAGMA_VALUE.match(str(value)):
+                raise ValueError('Invalid SQLite pragma %s=%r.'
+                                 % (name, value))
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def estimated_count(queryset):
+    """
+    Return a cheap estimate of the number of rows of an unfiltered table.
+
+    PostgreSQL answers from the planner statistics, without scanning the
+    table. The estimate is None when the database has no statistics yet
+    and on other databases, which have to count the rows.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] >= 0 else None
@@ -0,0 +1,122 @@
+"""Publish/subscribe of live tally changes for Django polls application."""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Delivered instead of the dropped messages when a subscriber fell behind,
+# telling it to reload the full tallies.
+RESYNC = {'resync': True}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Broker:
+    """
+    Interface of the tally change brokers.
+
+    ``publish`` is called from the synchronous write path and may run in
+    any thread. ``subscribe`` and ``unsubscribe`` are called from the event
+    loop serving a stream. A broker for several processes (Redis, Postgres
+    LISTEN/NOTIFY, ...) implements the same three methods.
+    """
+
+    def publish(self, question_id, message):
+        """Send `message` to every subscriber of `question_id`."""
+        raise NotImplementedError
+
+    def subscribe(self, question_id):
+        """Return a ``Subscription`` to the messages of `question_id`."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        """Stop delivering messages to a closed `subscription`."""
+        raise NotImplementedError
+
+
+class Subscription:
+    """Messages of one question queued for one stream."""
+
+    def __init__(self, broker, question_id, max_pending=100):
+        """Create the queue on the running event loop."""
+        self.broker = broker
+        self.question_id = question_id
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(max_pending)
+
+    async def get(self):
+        """Wait for and return the next message."""
+        return await self.queue.get()
+
+    def deliver(self, message):
+        """Queue `message`, on the subscription's event loop thread."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    def discard_pending(self):
+        """Drop the queued messages, return whether there were any."""
+        pending = not self.queue.empty()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        return pending
+
+    def close(self):
+        """Stop receiving messages."""
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(Broker):
+    """Broker delivering messages to the streams of this process only."""
+
+    def __init__(self):
+        """Create a broker without subscribers."""
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, question_id, message):
+        """Hand `message` to the event loop of every subscriber."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(question_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver,
+                                                   message)
+
+    def subscribe(self, question_id):
+        """Return a new subscription to `question_id`."""
+        subscription = Subscription(self, question_id)
+        with self._lock:
+            self._subscriptions[question_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Forget a closed subscription."""
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.question_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.question_id]
+
+
+def get_broker():
+    """Return the broker configured by ``POLLS_EVENT_BROKER``."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.POLLS_EVENT_BROKER)()
+        return _broker
+
+
+def publish_tallies(question_id, deltas):
+    """Announce that the votes of some choices changed by `deltas`."""
+    deltas = {choice_id: amount for choice_id, amount in deltas.items()
+              if amount}
+    if deltas:
+        get_broker().publish(question_id, {'deltas': deltas})
@@ -0,0 +1,97 @@
+"""Streaming CSV and JSON exports of Django polls application."""
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+
+from .cache import get_results
+from .models import Vote
+from .voting import BULK_BATCH_SIZE
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def export_chunks(question, kind, fmt, chunk_size=BULK_BATCH_SIZE):
+    """
+    Return the ``kind`` export of `question` as an iterator of bytes.
+
+    ``kind`` is ``'results'`` (one row per choice) or ``'votes'`` (one row
+    per vote) and ``fmt`` is ``'csv'`` or ``'json'``. Rows are produced
+    and encoded `chunk_size` at a time, so memory stays constant however
+    many votes there are and the first bytes go out before the last row
+    is read.
+    """
+    rows = {'results': result_rows, 'votes': vote_rows}[kind](
+        question, chunk_size)
+    encode = {'csv': _csv_chunks, 'json': _json_chunks}[fmt]
+    for chunk in encode(rows, chunk_size):
+        yield chunk.encode()
+
+
+def result_rows(question, chunk_size=BULK_BATCH_SIZE):
+    """Yield a header then the tally row of every choice of `question`."""
+    yield 'choice_id', 'choice_text', 'votes', 'percent'
+    for row in get_results(question):
+        yield row['id'], row['choice_text'], row['votes'], row['percent']
+
+
+def vote_rows(question, chunk_size=BULK_BATCH_SIZE):
+    """
+    Yield a header then one row per vote on `question`, oldest first.
+
+    Votes are read from their shard with a chunked iterator, and the
+    usernames of each chunk with one more query: users live in the default
+    database, so they cannot be joined.
+    """
+    yield 'vote_id', 'user_id', 'username', 'choice_id', 'choice_text'
+    choices = dict(question.choice_set.values_list('pk', 'choice_text'))
+    votes = Vote.objects.for_question(question.pk).order_by('pk') \
+        .values_list('pk', 'user_id', 'choice_id') \
+        .iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(votes, chunk_size))
+        if not chunk:
+            return
+        usernames = dict(User.objects.filter(
+            pk__in=[user_id for _, user_id, _ in chunk])
+            .values_list('pk', 'username'))
+        for pk, user_id, choice_id in chunk:
+            yield (pk, user_id, usernames.get(user_id, ''), choice_id,
+                   choices.get(choice_id, ''))
+
+
+class _Echo:
+    """File-like object returning what is written, for ``csv.writer``."""
+
+    def write(self, value):
+        """Return `value` instead of storing it."""
+        return value
+
+
+def _csv_chunks(rows, chunk_size):
+    """Yield the CSV text of `rows`, `chunk_size` rows at a time."""
+    writer = csv.writer(_Echo())
+    while True:
+        chunk = ''.join(writer.writerow(row)
+                        for row in islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _json_chunks(rows, chunk_size):
+    """Yield a JSON array of objects keyed by the header of `rows`."""
+    header = next(rows)
+    separator = '[\n'
+    while True:
+        chunk = [json.dumps(dict(zip(header, row)))
+                 for row in islice(rows, chunk_size)]
+        if not chunk:
+            break
+        yield separator + ',\n'.join(chunk)
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
@@ -0,0 +1,177 @@
+"""
+Per-view query and latency instrumentation for Django polls application.
+
+Enable it with ``POLLS_INSTRUMENTATION = True``: every response then gets a
+``Server-Timing`` header and the totals per view are published in the
+Prometheus text format at ``/polls/_metrics``, for staff users or requests
+bearing ``POLLS_METRICS_TOKEN``. ``max_queries`` lets tests
+fail when a code path runs more queries than its budget.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+METRICS = (
+    ('requests', 'polls_view_requests_total', 'counter',
+     'Requests served by the view.'),
+    ('queries', 'polls_view_queries_total', 'counter',
+     'SQL queries run while serving the view.'),
+    ('db_seconds', 'polls_view_db_seconds_total', 'counter',
+     'Seconds spent running SQL queries.'),
+    ('render_seconds', 'polls_view_render_seconds_total', 'counter',
+     'Seconds spent rendering template responses.'),
+    ('seconds', 'polls_view_seconds_total', 'counter',
+     'Wall clock seconds spent serving the view.'),
+)
+
+
+class Registry:
+    """Totals of the instrumented requests, per view name."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._lock = threading.Lock()
+        self._views = defaultdict(lambda: dict.fromkeys(
+            (key for key, _, _, _ in METRICS), 0))
+
+    def record(self, view, **sample):
+        """Add the measurements of one request of `view`."""
+        with self._lock:
+            totals = self._views[view]
+            totals['requests'] += 1
+            for key, value in sample.items():
+                totals[key] += value
+
+    def snapshot(self):
+        """Return a copy of the totals of every view."""
+        with self._lock:
+            return {view: dict(totals)
+                    for view, totals in self._views.items()}
+
+    def clear(self):
+        """Forget every measurement."""
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
+
+
+class _QueryTimer:
+    """Database execute wrapper counting and timing queries."""
+
+    def __init__(self):
+        """Start from zero queries."""
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Run one query, counting it and its duration."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - start
+
+
+class InstrumentationMiddleware:
+    """
+    Measure queries, database time, render time and wall time per view.
+
+    Render time covers ``TemplateResponse`` objects, i.e. the class-based
+    views; function views rendering with ``render()`` count it as view
+    time.
+    """
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Serve `request` and record its measurements."""
+        timer = _QueryTimer()
+        request._polls_render_seconds = 0.0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - start
+        render_seconds = request._polls_render_seconds
+        match = getattr(request, 'resolver_match', None)
+        registry.record(match.view_name if match else 'unresolved',
+                        queries=timer.queries, db_seconds=timer.seconds,
+                        render_seconds=render_seconds, seconds=seconds)
+        response['Server-Timing'] = ', '.join([
+            'db;dur=%.3f;desc="%d queries"' % (1000 * timer.seconds,
+                                               timer.queries),
+            'render;dur=%.3f' % (1000 * render_seconds),
+            'total;dur=%.3f' % (1000 * seconds),
+        ])
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of template responses."""
+        render = response.render
+
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request._polls_render_seconds += time.perf_counter() - start
+
+        response.render = timed_render
+        return response
+
+
+def metrics(request):
+    """Publish the per-view totals in the Prometheus text format."""
+    if not settings.POLLS_INSTRUMENTATION:
+        raise Http404('Instrumentation is disabled.')
+    if not _may_read_metrics(request):
+        raise PermissionDenied
+    views = registry.snapshot()
+    lines = []
+    for key, name, kind, description in METRICS:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for view, totals in sorted(views.items()):
+            lines.append('%s{view="%s"} %s' % (name, view, totals[key]))
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
+
+
+def _may_read_metrics(request):
+    """Return whether `request` is from staff or bears the metrics token."""
+    token = settings.POLLS_METRICS_TOKEN
+    if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+        return True
+    return request.user.is_active and request.user.is_staff
+
+
+@contextmanager
+def max_queries(budget, using='default'):
+    """
+    Fail with ``AssertionError`` when the block runs over `budget` queries.
+
+    The error lists the queries that ran, which makes N+1 patterns easy to
+    spot in a test failure.
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > budget:
+        raise AssertionError('%d queries over a budget of %d:\n%s' % (
+            len(context), budget,
+            '\n'.join(query['sql'] for query in context.captured_queries)))
@@ -0,0 +1,81 @@
+"""Management command comparing the WSGI and ASGI deployments."""
+import json
+import random
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from polls.bench import benchmark_database, polls_urlconf, \
+    run_concurrent, run_threaded, seed
+from polls.schedule import get_schedule
+
+
+class Command(BaseCommand):
+    """Drive one polls page through the WSGI and the ASGI handler."""
+
+    help = 'Seed a benchmark data set in a throwaway database and compare ' \
+           'throughput and latency of a polls page served by the sync ' \
+           'views through WSGI and the async views through ASGI.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--page', default='results',
+                            choices=['index', 'detail', 'results'])
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--output', help='Also write the JSON report '
+                                             'to this file.')
+
+    def handle(self, *args, **options):
+        """Run both handlers in a fresh database and report them."""
+        with benchmark_database():
+            report = self.benchmark(options)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        self.stdout.write(output)
+
+    def benchmark(self, options):
+        """Seed the data set and drive both handlers on the same page."""
+        graph, _ = seed(options['questions'], options['choices'],
+                        options['users'], options['votes'],
+                        seed=options['seed'])
+        schedule = get_schedule()
+        open_ids = [pk for pk in graph if schedule.is_open(pk)]
+        if not open_ids:
+            raise CommandError('The seeded questions are all closed.')
+        question_id = random.Random(options['seed']).choice(open_ids)
+        url = {
+            'index': '/polls/',
+            'detail': '/polls/%d/' % question_id,
+            'results': '/polls/%d/results/' % question_id,
+        }[options['page']]
+        total, concurrency = options['requests'], options['concurrency']
+
+        def wsgi_worker():
+            client = Client()
+            return lambda: client.get(url).status_code
+
+        def asgi_worker():
+            client = AsyncClient()
+
+            async def send():
+                return (await client.get(url)).status_code
+            return send
+
+        report = {'page': options['page'], 'concurrency': concurrency}
+        with override_settings(ROOT_URLCONF=polls_urlconf(False),
+                               ALLOWED_HOSTS=['testserver']):
+            report['wsgi'] = run_threaded(wsgi_worker, total, concurrency)
+        with override_settings(ROOT_URLCONF=polls_urlconf(True),
+                               ALLOWED_HOSTS=['testserver']):
+            report['asgi'] = async_to_sync(run_concurrent)(
+                asgi_worker, total, concurrency)
+        return report
@@ -0,0 +1,78 @@
+"""Management command benchmarking the streaming exports."""
+import json
+import time
+import tracemalloc
+
+from django.contrib.auth.models import Permission, User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from polls.bench import benchmark_database, seed
+
+
+class Command(BaseCommand):
+    """Seed one large poll and time its vote exports."""
+
+    help = 'Seed a throwaway database with one large poll and report the ' \
+           'time to first byte, duration, size and peak memory of its ' \
+           'vote exports, as CSV and JSON, with and without gzip.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--votes', type=int, default=100000)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--output', help='Also write the JSON report '
+                                             'to this file.')
+
+    def handle(self, *args, **options):
+        """Run the exports in a fresh database and report them."""
+        with benchmark_database(), \
+                override_settings(ALLOWED_HOSTS=['testserver']):
+            graph, _ = seed(questions=1, choices=options['choices'],
+                            users=options['votes'], votes=options['votes'],
+                            seed=0)
+            staff = User.objects.create_user('export-staff')
+            staff.user_permissions.add(
+                Permission.objects.get(codename='view_vote'))
+            client = Client()
+            client.force_login(staff)
+            report = {'votes': options['votes'], 'exports': {}}
+            for fmt in ('csv', 'json'):
+                url = reverse('polls:export', args=(
+                    next(iter(graph)), 'votes', fmt))
+                for encoding in ('identity', 'gzip'):
+                    report['exports']['%s+%s' % (fmt, encoding)] = \
+                        self.measure(client, url, encoding, options['votes'])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        self.stdout.write(output)
+
+    def measure(self, client, url, encoding, rows):
+        """Download one export, timed, then again to trace its memory."""
+        start = time.perf_counter()
+        response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+        first_byte = size = None
+        for chunk in response.streaming_content:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+                size = 0
+            size += len(chunk)
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        try:
+            for _ in client.get(url, HTTP_ACCEPT_ENCODING=encoding) \
+                    .streaming_content:
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'first_byte_ms': round(first_byte * 1000, 2),
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(rows / seconds, 1),
+            'bytes': size,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
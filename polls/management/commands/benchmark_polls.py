@@ -0,0 +1,148 @@
+"""Management command benchmarking the polls hot paths."""
+import json
+import platform
+import random
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from polls.bench import benchmark_database, count_queries, hot_paths, \
+    run_sequential, run_threaded, seed, user_logins
+from polls.voting import cast_vote, cast_votes_bulk
+
+
+class Command(BaseCommand):
+    """Seed a throwaway database and measure the polls endpoints."""
+
+    help = 'Seed a benchmark data set in a throwaway database, drive the ' \
+           'index, detail, results and vote endpoints and report req/s, ' \
+           'latency percentiles and query counts as JSON.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here.')
+        parser.add_argument('--compare', help='Compare with the JSON report '
+                                              'of an earlier run.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Slowdown ratio reported as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        """Run the benchmark in a fresh database and report it."""
+        with benchmark_database(), \
+                override_settings(ALLOWED_HOSTS=['testserver']):
+            report = self.benchmark(options)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        self.stdout.write(output)
+        if options['compare']:
+            self.compare(report, options)
+
+    def benchmark(self, options):
+        """Seed the data set and measure every endpoint."""
+        rng = random.Random(options['seed'])
+        graph, user_ids = seed(options['questions'], options['choices'],
+                               options['users'], options['votes'],
+                               seed=options['seed'])
+        total, concurrency = options['requests'], options['concurrency']
+        next_user = user_logins(user_ids)
+        report = {'meta': self.meta(options), 'endpoints': {}}
+        for name, (login, send) in hot_paths(graph, user_ids, rng).items():
+            def make_worker(login=login, send=send):
+                client = Client()
+                if login:
+                    client.force_login(next_user())
+                return lambda: send(client).status_code
+
+            worker = make_worker()
+            report['endpoints'][name] = {
+                'queries': count_queries(worker),
+                'sequential': run_sequential(worker, total),
+                'concurrent': run_threaded(make_worker, total, concurrency),
+            }
+        report['ballots'] = self.ballot_throughput(graph, user_ids, rng,
+                                                   total)
+        return report
+
+    def ballot_throughput(self, graph, user_ids, rng, total):
+        """Compare ballots/s of single votes and of one bulk batch."""
+        from django.contrib.auth.models import User
+        from polls.models import Choice, Question
+
+        def ballots():
+            for _ in range(total):
+                question_id = rng.choice(list(graph))
+                yield (rng.choice(user_ids), question_id,
+                       rng.choice(graph[question_id]))
+
+        single = list(ballots())
+        users = User.objects.in_bulk({user for user, _, _ in single})
+        questions = Question.objects.in_bulk({q for _, q, _ in single})
+        choices = Choice.objects.in_bulk({c for _, _, c in single})
+        start = timezone.now()
+        for user_id, question_id, choice_id in single:
+            cast_vote(users[user_id], questions[question_id],
+                      choices[choice_id])
+        single_seconds = (timezone.now() - start).total_seconds()
+        start = timezone.now()
+        cast_votes_bulk(list(ballots()))
+        bulk_seconds = (timezone.now() - start).total_seconds()
+        return {
+            'single_per_sec': round(total / single_seconds, 1),
+            'bulk_per_sec': round(total / bulk_seconds, 1),
+        }
+
+    def meta(self, options):
+        """Describe the run so reports of several commits can be compared."""
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                cwd=settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'date': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in (
+                'questions', 'choices', 'users', 'votes', 'requests',
+                'concurrency', 'seed')},
+        }
+
+    def compare(self, report, options):
+        """Print the changes against an earlier report, flag regressions."""
+        with open(options['compare']) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = []
+        for name, current in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if before is None:
+                continue
+            p50 = current['sequential']['p50_ms']
+            old_p50 = before['sequential']['p50_ms']
+            line = '%-8s queries %d -> %d, p50 %.2f -> %.2f ms' % (
+                name, before['queries'], current['queries'], old_p50, p50)
+            if current['queries'] > before['queries'] or \
+                    p50 > old_p50 * (1 + options['tolerance']):
+                regressions.append(name)
+                line += '  REGRESSION'
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError('Regressions in: %s' % ', '.join(regressions))
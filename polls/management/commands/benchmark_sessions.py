@@ -0,0 +1,77 @@
+"""Management command measuring the session and auth cost of votes."""
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from polls.bench import benchmark_database, count_queries, hot_paths, \
+    run_sequential, seed
+
+SESSION_PROFILES = ('db', 'cached_db', 'cache', 'signed_cookies')
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+CACHED_BACKEND = 'polls.auth.CachedModelBackend'
+
+
+class Command(BaseCommand):
+    """Compare authenticated votes across session and auth setups."""
+
+    help = 'Cast authenticated votes with every SESSION_PROFILE, with and ' \
+           'without the cached user lookup, and report the queries and ' \
+           'latency of one vote as JSON.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here.')
+
+    def handle(self, *args, **options):
+        """Seed a throwaway database and vote with each setup."""
+        report = {}
+        with benchmark_database(), \
+                override_settings(ALLOWED_HOSTS=['testserver']):
+            graph, user_ids = seed(options['questions'], 4, options['users'],
+                                   0, seed=options['seed'])
+            voters = iter(user_ids)
+            for profile in SESSION_PROFILES:
+                for backend in (MODEL_BACKEND, CACHED_BACKEND):
+                    name = '%s%s' % (profile, '+cached_auth'
+                                     if backend == CACHED_BACKEND else '')
+                    with override_settings(
+                            SESSION_ENGINE='django.contrib.sessions.'
+                                           'backends.%s' % profile,
+                            AUTHENTICATION_BACKENDS=[backend]):
+                        report[name] = self.vote(graph, next(voters),
+                                                 options)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        self.stdout.write(output)
+
+    def vote(self, graph, user_id, options):
+        """
+        Log a fresh voter in and measure the same sequence of votes.
+
+        Each setup starts from an empty cache with a voter who has not
+        voted yet, so the query counts of the setups are comparable.
+        """
+        cache.clear()
+        _, send = hot_paths(graph, [user_id],
+                            random.Random(options['seed']))['vote']
+        client = Client()
+        client.force_login(User.objects.get(pk=user_id))
+        total = options['requests']
+        report = {}
+
+        def run():
+            report.update(run_sequential(
+                lambda: send(client).status_code, total))
+
+        queries = count_queries(run)
+        return dict(report, queries_per_vote=round(queries / total, 2))
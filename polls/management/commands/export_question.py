@@ -0,0 +1,46 @@
+"""Management command exporting the results or votes of a question."""
+import gzip
+import sys
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import CONTENT_TYPES, export_chunks
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Write the results or votes of one question as CSV or JSON."""
+
+    help = 'Export the results or the raw votes of a question as CSV or ' \
+           'JSON, streamed in constant memory.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('question_id', type=int)
+        parser.add_argument('--kind', default='votes',
+                            choices=['results', 'votes'])
+        parser.add_argument('--format', default='csv',
+                            choices=sorted(CONTENT_TYPES))
+        parser.add_argument('--output', help='Write to this file instead '
+                                             'of the standard output.')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Compress the export with gzip.')
+
+    def handle(self, *args, **options):
+        """Stream the export to the output."""
+        question = Question.objects.select_related('snapshot') \
+            .filter(pk=options['question_id']).first()
+        if question is None:
+            raise CommandError('No question %d.' % options['question_id'])
+        with ExitStack() as stack:
+            if options['output']:
+                output = stack.enter_context(open(options['output'], 'wb'))
+            else:
+                output = sys.stdout.buffer
+            if options['gzip']:
+                output = stack.enter_context(
+                    gzip.GzipFile(fileobj=output, mode='wb'))
+            for chunk in export_chunks(question, options['kind'],
+                                       options['format']):
+                output.write(chunk)
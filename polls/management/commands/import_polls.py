@@ -0,0 +1,199 @@
+"""Management command importing polls in bulk."""
+import csv
+import json
+import os
+import random
+from functools import lru_cache
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from polls.bench import seed_users, seed_votes
+from polls.cache import invalidate_index
+from polls.models import Choice, Question
+from polls.schedule import reload_schedules
+
+
+class Command(BaseCommand):
+    """Load questions and their choices from a JSON, YAML or CSV file."""
+
+    help = 'Import questions and choices in bulk from a .json, .yaml/.yml ' \
+           '(needs PyYAML) or .csv file. JSON and YAML hold a list of ' \
+           '{question_text, pub_date, end_date, choices: [...]} objects; ' \
+           'CSV has those columns with the choices separated by "|". ' \
+           'Naive dates are in TIME_ZONE. Optionally add synthetic users ' \
+           'and votes for load testing.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Questions inserted per batch.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the file.')
+        parser.add_argument('--synthetic-users', type=int, default=0,
+                            help='Also create this many users.')
+        parser.add_argument('--synthetic-votes', type=int, default=0,
+                            help='Also cast this many random votes of the '
+                                 'synthetic users on the imported polls.')
+        parser.add_argument('--seed', type=int, help='Random seed of the '
+                                                     'synthetic votes.')
+
+    def handle(self, *args, **options):
+        """Validate the whole file, then insert it in one transaction."""
+        polls, errors = [], []
+        for line, record in self.read(options['path']):
+            try:
+                polls.append(self.validate(record))
+            except ValueError as error:
+                errors.append('Poll %d: %s' % (line, error))
+        if errors:
+            raise CommandError('\n'.join(errors[:20] + (
+                ['... %d more' % (len(errors) - 20)] if len(errors) > 20
+                else [])))
+        if options['dry_run']:
+            self.stdout.write('%d poll(s) are valid.' % len(polls))
+            return
+        if options['synthetic_votes'] and not options['synthetic_users']:
+            raise CommandError('--synthetic-votes needs --synthetic-users.')
+
+        batch_size = options['batch_size']
+        graph = {}
+        with transaction.atomic():
+            choices = 0
+            batches = iter(polls)
+            while True:
+                batch = list(islice(batches, batch_size))
+                if not batch:
+                    break
+                questions = [question for question, _ in batch]
+                question_ids = insert_returning_ids(Question, questions,
+                                                    batch_size)
+                new_choices = [
+                    Choice(question_id=question_id, choice_text=text)
+                    for question_id, (_, texts) in zip(question_ids, batch)
+                    for text in texts]
+                Choice.objects.bulk_create(new_choices, batch_size=batch_size)
+                choices += len(new_choices)
+                graph.update((question_id, []) for question_id in question_ids)
+            transaction.on_commit(invalidate_index)
+            transaction.on_commit(reload_schedules)
+            if options['synthetic_users']:
+                self.add_votes(graph, options)
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %d question(s) with %d choice(s).' % (len(graph),
+                                                            choices)))
+
+    def read(self, path):
+        """Yield ``(number, record)`` for every poll of the file."""
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            with open(path, newline='', encoding='utf-8') as source:
+                if extension == '.csv':
+                    for number, row in enumerate(csv.DictReader(source), 1):
+                        row['choices'] = [text for text in (
+                            row.get('choices') or '').split('|') if text]
+                        yield number, row
+                    return
+                if extension == '.json':
+                    records = json.load(source)
+                elif extension in ('.yaml', '.yml'):
+                    try:
+                        import yaml
+                    except ImportError:
+                        raise CommandError('Importing YAML needs PyYAML.')
+                    records = yaml.safe_load(source)
+                else:
+                    raise CommandError('Unknown file type %r.' % extension)
+        except (OSError, ValueError) as error:
+            raise CommandError('Cannot read %s: %s' % (path, error))
+        if isinstance(records, dict):
+            records = records.get('questions')
+        if not isinstance(records, list):
+            raise CommandError('Expected a list of polls.')
+        yield from enumerate(records, 1)
+
+    def validate(self, record):
+        """Return the unsaved question and choice texts of one record."""
+        if not isinstance(record, dict):
+            raise ValueError('not an object.')
+        text = str(record.get('question_text') or '').strip()
+        if not text:
+            raise ValueError('question_text is missing.')
+        if len(text) > Question._meta.get_field('question_text').max_length:
+            raise ValueError('question_text is too long.')
+        dates = [self.parse_date(record, name)
+                 for name in ('pub_date', 'end_date')]
+        if dates[0] >= dates[1]:
+            raise ValueError('pub_date must be before end_date.')
+        choices = record.get('choices') or []
+        if not isinstance(choices, list) or not choices:
+            raise ValueError('choices must be a non-empty list.')
+        choices = [str(choice).strip() for choice in choices]
+        if not all(choices) or max(map(len, choices)) > \
+                Choice._meta.get_field('choice_text').max_length:
+            raise ValueError('choices must be non-empty and short enough.')
+        return Question(question_text=text, pub_date=dates[0],
+                        end_date=dates[1]), choices
+
+    def parse_date(self, record, name):
+        """Return the aware datetime of one field of a record."""
+        value = record.get(name)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        date = parse_aware_datetime(str(value or ''))
+        if date is None:
+            raise ValueError('%s is not a date and time.' % name)
+        return date
+
+    def add_votes(self, graph, options):
+        """Create the synthetic users and their votes on the new polls."""
+        user_ids = seed_users(options['synthetic_users'])
+        ids = list(graph)
+        for start in range(0, len(ids), options['batch_size']):
+            for choice_id, question_id in Choice.objects.filter(
+                    question__in=ids[start:start + options['batch_size']]) \
+                    .order_by('pk').values_list('pk', 'question_id'):
+                graph[question_id].append(choice_id)
+        votes = seed_votes(graph, user_ids, options['synthetic_votes'],
+                           rng=random.Random(options['seed']))
+        self.stdout.write('Created %d user(s) and %d vote(s).' % (
+            len(user_ids), votes))
+
+
+@lru_cache(maxsize=4096)
+def parse_aware_datetime(value):
+    """
+    Return `value` parsed as an aware datetime, or None.
+
+    Imported polls mostly share a few dates, so the parsing and the time
+    zone lookups are cached.
+    """
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        return None
+    if date is not None and timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def insert_returning_ids(model, objs, batch_size):
+    """
+    Insert `objs` with ``bulk_create`` and return their ids, in order.
+
+    Databases that cannot return the ids of a bulk insert (SQLite before
+    Django 4.0) are asked for the highest ids afterwards: inside the
+    transaction the import holds the write lock and ids only grow, so the
+    last ``len(objs)`` of them are the new rows.
+    """
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    if not objs or objs[0].pk is not None:
+        return [obj.pk for obj in objs]
+    if not connection.in_atomic_block:
+        raise RuntimeError('Needs a transaction to read the ids back.')
+    return sorted(model.objects.order_by('-pk')
+                  .values_list('pk', flat=True)[:len(objs)])
@@ -0,0 +1,91 @@
+"""Management command moving votes to the shard of their question."""
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from polls.cache import invalidate_results
+from polls.models import Choice, Vote
+from polls.sharding import shard_for_question, vote_databases
+from polls.tallies import get_tallies
+
+
+class Command(BaseCommand):
+    """Move the votes stored on another shard than their question's."""
+
+    help = 'Move every vote to the shard its question is placed on, after ' \
+           'POLLS_VOTE_SHARDS or POLLS_VOTE_SHARD_PINS changed.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Votes moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the votes to move.')
+
+    def handle(self, *args, **options):
+        """Move the misplaced votes question by question."""
+        moved = 0
+        for source in vote_databases():
+            question_ids = Vote.objects.using(source).order_by() \
+                .values_list('question', flat=True).distinct()
+            for question_id in list(question_ids):
+                target = shard_for_question(question_id)
+                if target == source:
+                    continue
+                if options['dry_run']:
+                    count = Vote.objects.using(source) \
+                        .filter(question=question_id).count()
+                else:
+                    count = self.move(question_id, source, target,
+                                      options['batch_size'])
+                    invalidate_results(question_id)
+                moved += count
+                self.stdout.write('Question %d: %d vote(s) %s -> %s' % (
+                    question_id, count, source, target))
+        self.stdout.write(self.style.SUCCESS(
+            '%s %d vote(s).' % ('Would move' if options['dry_run']
+                                else 'Moved', moved)))
+
+    def move(self, question_id, source, target, batch_size):
+        """
+        Move the votes of one question from `source` to `target`.
+
+        Each batch is copied and deleted in one transaction on each shard.
+        A user who voted on `target` since the placement changed keeps that
+        vote, and the stale copy no longer counts for its choice. Deleting
+        the batch discounts every vote through the ``post_delete`` signal,
+        so the copied votes are counted back afterwards.
+        """
+        moved = 0
+        while True:
+            with transaction.atomic(using=source), \
+                    transaction.atomic(using=target), transaction.atomic():
+                batch = list(Vote.objects.using(source)
+                             .filter(question=question_id).order_by('pk')
+                             .select_for_update()[:batch_size])
+                if not batch:
+                    return moved
+                voted = set(Vote.objects.using(target).filter(
+                    question=question_id,
+                    user__in=[vote.user_id for vote in batch])
+                    .values_list('user', flat=True))
+                copied = [vote for vote in batch if vote.user_id not in voted]
+                Vote.objects.using(target).bulk_create(
+                    [Vote(question_id=question_id, user_id=vote.user_id,
+                          choice_id=vote.choice_id) for vote in copied])
+                Vote.objects.using(source).filter(
+                    pk__in=[vote.pk for vote in batch]).delete()
+                recount(Counter(vote.choice_id for vote in copied))
+            moved += len(batch)
+
+
+def recount(deltas):
+    """Count the votes of `deltas` back after their rows were moved."""
+    for choice_id, delta in deltas.items():
+        Choice.objects.filter(pk=choice_id).update(
+            vote_count=F('vote_count') + delta)
+    tallies = get_tallies()
+    if tallies is not None and deltas:
+        transaction.on_commit(lambda: tallies.add(deltas))
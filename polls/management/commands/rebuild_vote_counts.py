@@ -0,0 +1,61 @@
+"""Management command that rebuilds the choice vote counters."""
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import Choice, Vote
+from polls.sharding import vote_databases
+
+
+class Command(BaseCommand):
+    """Rebuild or validate ``Choice.vote_count`` from the Vote table."""
+
+    help = 'Rebuild (or with --check, validate) the per-choice vote ' \
+           'counters from the Vote rows of every vote shard.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help='Only handle these questions.')
+        parser.add_argument('--check', action='store_true',
+                            help='Report drifted counters without fixing '
+                                 'them and exit with an error if any.')
+
+    def handle(self, *args, **options):
+        """Compare the counters with the real tallies and fix them."""
+        choices = Choice.objects.all()
+        votes = Vote.objects.order_by()
+        if options['question_ids']:
+            choices = choices.filter(question__in=options['question_ids'])
+            votes = votes.filter(question__in=options['question_ids'])
+        with transaction.atomic():
+            tallies = Counter()
+            for alias in vote_databases():
+                tallies.update(dict(votes.using(alias)
+                                    .values_list('choice')
+                                    .annotate(Count('pk'))))
+            drifted = [
+                choice for choice in choices.select_for_update()
+                .order_by('pk')
+                if choice.vote_count != tallies[choice.pk]
+            ]
+            for choice in drifted:
+                self.stdout.write(
+                    'Choice %d (question %d): counter %d, actual %d' % (
+                        choice.pk, choice.question_id,
+                        choice.vote_count, tallies[choice.pk]))
+            if options['check']:
+                if drifted:
+                    raise CommandError(
+                        '%d vote counter(s) out of sync.' % len(drifted))
+                self.stdout.write(self.style.SUCCESS(
+                    'All vote counters are in sync.'))
+                return
+            for choice in drifted:
+                choice.vote_count = tallies[choice.pk]
+            Choice.objects.bulk_update(drifted, ['vote_count'],
+                                       batch_size=500)
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt vote counters, %d were out of sync.' % len(drifted)))
@@ -0,0 +1,33 @@
+"""Management command reconciling the shared vote counters."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.tallies import count_votes, get_tallies
+
+
+class Command(BaseCommand):
+    """Reset the shared vote counters to the counts of the Vote table."""
+
+    help = 'Reset the memory-mapped vote counters of the mmap tally ' \
+           'backend to the Vote rows of every vote shard, once or every ' \
+           '--interval seconds.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--interval', type=float,
+                            help='Keep reconciling every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        """Reconcile the counters once or in a loop."""
+        tallies = get_tallies()
+        if tallies is None:
+            raise CommandError('POLLS_TALLY_BACKEND is not "mmap".')
+        while True:
+            votes = count_votes()
+            tallies.reconcile(votes)
+            self.stdout.write('Reconciled the counters of %d choice(s).'
+                              % len(votes))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
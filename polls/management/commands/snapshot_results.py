@@ -0,0 +1,32 @@
+"""Management command freezing the results of closed polls."""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.cache import drop_snapshots, snapshot_results
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Take the results snapshot of every closed question missing one."""
+
+    help = 'Freeze the per-choice tallies and percentages of closed polls, ' \
+           'so their results pages are served from one row. Run it from ' \
+           'a scheduled job; missing snapshots are also taken on the ' \
+           'first results request after a poll closes.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--refresh', action='store_true',
+                            help='Take the snapshots of closed polls again.')
+
+    def handle(self, *args, **options):
+        """Freeze the closed questions."""
+        closed = Question.objects.filter(end_date__lt=timezone.now())
+        if options['refresh']:
+            drop_snapshots(closed.values('pk'))
+        count = 0
+        for question in closed.filter(snapshot__isnull=True).iterator():
+            snapshot_results(question)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            'Took %d results snapshot(s).' % count))
@@ -0,0 +1,44 @@
+"""Management command standing in for replication of SQLite replicas."""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from polls.routers import replica_synced
+
+
+class Command(BaseCommand):
+    """Copy the primary SQLite database onto every read replica."""
+
+    help = 'Replication stand-in for local testing: copy the primary ' \
+           'SQLite database onto the POLLS_READ_REPLICAS files, once or ' \
+           'every --interval seconds, and record when they were synced.'
+
+    def add_arguments(self, parser):
+        """Add the command line arguments."""
+        parser.add_argument('--interval', type=float,
+                            help='Keep syncing every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        """Sync the replicas once or in a loop."""
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Real databases replicate by themselves.')
+        while True:
+            for alias in settings.POLLS_READ_REPLICAS:
+                started = time.time()
+                source = sqlite3.connect(primary.settings_dict['NAME'])
+                target = sqlite3.connect(
+                    connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    source.close()
+                    target.close()
+                replica_synced(alias, started)
+                self.stdout.write('Synced %s.' % alias)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:24
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Keep only the latest vote of each user per question."""
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    duplicates = (Vote.objects.values('question', 'user')
+                  .annotate(latest=Max('pk'), total=Count('pk'))
+                  .filter(total__gt=1).order_by())
+    for row in duplicates:
+        Vote.objects.filter(question=row['question'], user=row['user']) \
+            .exclude(pk=row['latest']).delete()
+    counts = (Vote.objects.filter(choice=OuterRef('pk')).order_by()
+              .values('choice').annotate(total=Count('pk')).values('total'))
+    Choice.objects.update(vote_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_choice_vote_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['question', 'choice'], name='polls_vote_question_choice'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('question', 'user'), name='polls_vote_one_per_user'),
+        ),
+    ]
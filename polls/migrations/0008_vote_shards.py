@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:02
+
+import copy
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations
+
+# Foreign keys of the votes pointing at rows of the default database.
+VOTE_FOREIGN_KEYS = ['question', 'choice', 'user']
+
+
+def alter_shard_constraints(apps, schema_editor, db_constraint):
+    """
+    Drop or restore the foreign key constraints of the votes on a shard.
+
+    A vote shard (see ``polls.sharding``) holds votes whose question,
+    choice and user live in the default database, so its vote table
+    cannot have the constraints. The default database keeps them.
+    """
+    if schema_editor.connection.alias == DEFAULT_DB_ALIAS:
+        return
+    Vote = apps.get_model('polls', 'Vote')
+    fields = [Vote._meta.get_field(name) for name in VOTE_FOREIGN_KEYS]
+    try:
+        for field in fields:
+            # SQLite rebuilds the table from the model's fields, so the
+            # fields altered before this one must already show the change.
+            old_field = copy.copy(field)
+            old_field.db_constraint = not db_constraint
+            field.db_constraint = db_constraint
+            schema_editor.alter_field(Vote, old_field, field)
+    finally:
+        for field in fields:
+            field.db_constraint = True
+
+
+def drop_shard_constraints(apps, schema_editor):
+    """Drop the vote constraints when migrating a shard forwards."""
+    alter_shard_constraints(apps, schema_editor, False)
+
+
+def restore_shard_constraints(apps, schema_editor):
+    """Restore the vote constraints when migrating a shard backwards."""
+    alter_shard_constraints(apps, schema_editor, True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0007_question_schedule_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_shard_constraints,
+                             restore_shard_constraints),
+    ]
@@ -3,9 +3,12 @@
 import datetime
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Case, Count, IntegerField, Value, When
 from django.utils import timezone
 
+from .sharding import shard_for_question
+
 
 class Question(models.Model):
     """question class for  Django polls application."""
@@ -14,6 +17,14 @@ class Question(models.Model):
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('Date that polls expires')
 
+    class Meta:
+        """Index the schedule columns used by the index page."""
+
+        indexes = [
+            models.Index(fields=['pub_date', 'end_date'],
+                         name='polls_question_schedule'),
+        ]
+
     def __str__(self):
         """Return a string represent for question class."""
         return self.question_text
@@ -40,12 +51,36 @@ class Question(models.Model):
     was_published_recently.boolean = True
     was_published_recently.short_description = 'Published recently?'
 
+    def choices_with_votes(self):
+        """
+        Return the choices of this question annotated with vote counts.
+
+        All tallies are computed by a single grouped query, so iterating
+        the result and reading ``choice.votes`` costs no extra queries.
+        When the votes live on a shard they are counted there first.
+        """
+        votes = Vote.objects.for_question(self.pk)
+        if votes.db == DEFAULT_DB_ALIAS:
+            num_votes = Count('vote')
+        else:
+            num_votes = Case(
+                *[When(pk=choice_id, then=Value(total)) for choice_id, total
+                  in votes.order_by().values_list('choice')
+                  .annotate(Count('pk'))],
+                default=Value(0), output_field=IntegerField())
+        return self.choice_set.annotate(num_votes=num_votes).order_by('pk')
+
+    def tallies(self):
+        """Return a dict mapping each choice id to its number of votes."""
+        return dict(self.choices_with_votes().values_list('pk', 'num_votes'))
+
 
 class Choice(models.Model):
     """choice class for  Django polls application."""
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         """Return a string represent for choice class."""
@@ -53,12 +88,69 @@ class Choice(models.Model):
 
     @property
     def votes(self):
-        """Return the number of vote for each question."""
-        return self.question.vote_set.filter(choice=self).count()
+        """
+        Return the number of vote for each question.
+
+        Use the precomputed ``num_votes`` annotation when present (see
+        ``Question.choices_with_votes``), otherwise the ``vote_count``
+        counter maintained by ``polls.voting.cast_vote``.
+        """
+        if hasattr(self, 'num_votes'):
+            return self.num_votes
+        return self.vote_count
+
+
+class VoteQuerySet(models.QuerySet):
+    """QuerySet that finds the shard of the votes it reads."""
+
+    def for_question(self, question_id):
+        """Return the votes of one question, read from its shard."""
+        return self.using(shard_for_question(question_id)) \
+            .filter(question_id=question_id)
 
 
 class Vote(models.Model):
-    """Vote class for Django poll Application."""
+    """
+    Vote class for Django poll Application.
+
+    Votes may live on a shard rather than the database of the questions,
+    choices and users they point to (see ``polls.sharding``). Only the
+    default database enforces their foreign keys, migration 0008 drops
+    the constraints on the shards and ``polls.signals`` cascades deletes.
+    """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        """One vote per user and question, tallies grouped by choice."""
+
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'user'],
+                                    name='polls_vote_one_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'choice'],
+                         name='polls_vote_question_choice'),
+        ]
+
+
+class ResultSnapshot(models.Model):
+    """
+    Frozen results of a closed question.
+
+    ``results`` holds the rows of the results page, each with the ``id``,
+    ``choice_text``, ``votes`` and ``percent`` of one choice.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True, related_name='snapshot')
+    results = models.JSONField()
+    total_votes = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Return a string represent for result snapshot class."""
+        return 'Results of %s' % self.question
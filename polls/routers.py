@@ -0,0 +1,150 @@
+"""Database routing for Django polls application."""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .sharding import shard_for_question
+
+REPLICA_SYNCED_KEY = 'polls:replica:%s:synced'
+STICKY_COOKIE = 'polls_primary'
+
+_pinned = contextvars.ContextVar('polls_pinned_to_primary', default=False)
+# Routing state of the current request: the replica picked for its reads.
+_request = contextvars.ContextVar('polls_request_routing', default=None)
+
+
+def replica_synced(alias, synced_at=None):
+    """Record that replica `alias` holds every write made before now."""
+    cache.set(REPLICA_SYNCED_KEY % alias, synced_at or time.time(), None)
+
+
+def fresh_replicas():
+    """Return the replicas that lag at most ``POLLS_REPLICA_MAX_LAG`` s."""
+    replicas = settings.POLLS_READ_REPLICAS
+    if not replicas:
+        return []
+    synced = cache.get_many([REPLICA_SYNCED_KEY % alias
+                             for alias in replicas])
+    oldest = time.time() - settings.POLLS_REPLICA_MAX_LAG
+    return [alias for alias in replicas
+            if synced.get(REPLICA_SYNCED_KEY % alias, 0) >= oldest]
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block.
+
+    Used when filling shared caches, so that a value read from a lagging
+    replica is not served to everyone until it expires.
+    """
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def _request_replica():
+    """
+    Return the replica taking the reads of this request, None if none.
+
+    The replica is picked once per request served through
+    ``ReplicaStickinessMiddleware``, so its reads see one consistent
+    replica and the lag is looked up once; other reads pick every time.
+    """
+    state = _request.get()
+    if state is not None and 'replica' in state:
+        return state['replica']
+    replicas = fresh_replicas()
+    replica = random.choice(replicas) if replicas else None
+    if state is not None:
+        state['replica'] = replica
+    return replica
+
+
+class VoteShardRouter:
+    """
+    Send the votes reached from a question, choice or vote to their shard.
+
+    Related managers (``question.vote_set``) and saved ``Vote`` instances
+    carry the hint needed to find the shard. Other queries on ``Vote``
+    pick it explicitly with ``Vote.objects.for_question`` or ``using``.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Return the shard of the votes of the hinted question."""
+        if model._meta.label != 'polls.Vote':
+            return None
+        instance = hints.get('instance')
+        label = instance._meta.label if instance is not None else None
+        if label == 'polls.Question':
+            return shard_for_question(instance.pk)
+        if label in ('polls.Choice', 'polls.Vote') and \
+                instance.question_id is not None:
+            return shard_for_question(instance.question_id)
+        return None
+
+    db_for_write = db_for_read
+
+
+class ReplicaRouter:
+    """
+    Send reads of the polls models to a read replica.
+
+    Reads stay on the primary while the request is pinned to it (see
+    ``ReplicaStickinessMiddleware``), inside a transaction on the primary,
+    and when every replica lags more than ``POLLS_REPLICA_MAX_LAG``.
+    Writes and the other apps (sessions, auth, ...) always use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Pick a fresh replica for polls reads, else the primary."""
+        if model._meta.app_label != 'polls' or _pinned.get() or \
+                connections['default'].in_atomic_block:
+            return 'default'
+        return _request_replica() or 'default'
+
+    def db_for_write(self, model, **hints):
+        """Write to the primary."""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same rows as the primary."""
+        return True
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin the reads of a client that just wrote to the primary.
+
+    A successful unsafe request (a vote, a signup, ...) sets a cookie that
+    keeps the client's reads on the primary for
+    ``POLLS_REPLICA_STICKY_SECONDS``, long enough for the replicas to catch
+    up, so voters always see their own vote.
+    """
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Serve `request` pinned to the primary when needed."""
+        wrote = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        token = _pinned.set(wrote or STICKY_COOKIE in request.COOKIES)
+        state = _request.set({})
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(state)
+            _pinned.reset(token)
+        if wrote and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE, '1', httponly=True, samesite='Lax',
+                max_age=settings.POLLS_REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,255 @@
+"""Process-level index of the poll schedule of Django polls application."""
+import copy
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Question
+from .routers import use_primary
+
+
+class ScheduleIndex:
+    """
+    Sorted index of the ``pub_date`` and ``end_date`` of every question.
+
+    Questions are kept sorted by ``(pub_date, pk)`` and every date at which
+    a question opens or closes is kept in a sorted list, so finding the
+    published questions, a page of them and the next state transition are
+    binary searches. The index reflects the question list up to change
+    `seq` of the schedule log of `epoch`, see ``record_question``.
+    """
+
+    def __init__(self, rows, epoch=None, seq=0):
+        """Index the ``(pk, pub_date, end_date)`` `rows`."""
+        self.epoch = epoch
+        self.seq = seq
+        self.loaded = time.monotonic()
+        self.dates = {pk: (pub_date, end_date)
+                      for pk, pub_date, end_date in rows}
+        self.by_pub_date = sorted((pub_date, pk) for pk, (pub_date, _)
+                                  in self.dates.items())
+        self.date_counts = Counter(date for dates in self.dates.values()
+                                   for date in set(dates))
+        self.transitions = sorted(self.date_counts)
+
+    @classmethod
+    def load(cls, epoch=None, seq=0):
+        """Build the index of the questions in the primary database."""
+        with use_primary():
+            rows = list(Question.objects.values_list('pk', 'pub_date',
+                                                     'end_date'))
+        return cls(rows, epoch, seq)
+
+    def copy(self):
+        """Return a copy of the index that can be updated on its own."""
+        other = copy.copy(self)
+        other.dates = dict(self.dates)
+        other.by_pub_date = list(self.by_pub_date)
+        other.date_counts = Counter(self.date_counts)
+        other.transitions = list(self.transitions)
+        return other
+
+    def update(self, pk, dates):
+        """Index question `pk` with ``(pub_date, end_date)`` `dates`."""
+        self.remove(pk)
+        self.dates[pk] = dates
+        insort(self.by_pub_date, (dates[0], pk))
+        for date in set(dates):
+            if not self.date_counts[date]:
+                insort(self.transitions, date)
+            self.date_counts[date] += 1
+
+    def remove(self, pk):
+        """Drop question `pk` from the index, if it is there."""
+        dates = self.dates.pop(pk, None)
+        if dates is None:
+            return
+        del self.by_pub_date[bisect_left(self.by_pub_date, (dates[0], pk))]
+        for date in set(dates):
+            self.date_counts[date] -= 1
+            if not self.date_counts[date]:
+                del self.date_counts[date]
+                del self.transitions[bisect_left(self.transitions, date)]
+
+    def __contains__(self, pk):
+        """Return whether question `pk` exists."""
+        return pk in self.dates
+
+    def is_published(self, pk, now=None):
+        """Return whether question `pk` is published at `now`."""
+        dates = self.dates.get(pk)
+        return dates is not None and dates[0] <= (now or timezone.now())
+
+    def is_open(self, pk, now=None):
+        """Return whether question `pk` can be voted on at `now`."""
+        dates = self.dates.get(pk)
+        now = now or timezone.now()
+        return dates is not None and dates[0] <= now <= dates[1]
+
+    def published(self, now=None, position=None, limit=None):
+        """
+        Return the ids of the questions published at `now`, newest first.
+
+        With a ``(pub_date, pk)`` `position` only the questions after it in
+        that order are returned, at most `limit` of them.
+        """
+        end = bisect_right(self.by_pub_date,
+                           (now or timezone.now(), float('inf')))
+        if position is not None:
+            end = min(end, bisect_left(self.by_pub_date, tuple(position)))
+        start = 0 if limit is None else max(end - limit, 0)
+        return [pk for _, pk in reversed(self.by_pub_date[start:end])]
+
+    def next_transition(self, now=None):
+        """Return when the next question opens or closes, or None."""
+        index = bisect_right(self.transitions, now or timezone.now())
+        return self.transitions[index] \
+            if index < len(self.transitions) else None
+
+
+SCHEDULE_EPOCH_KEY = 'polls:schedule:epoch'
+SCHEDULE_SEQ_KEY = 'polls:schedule:seq'
+SCHEDULE_CHANGE_KEY = 'polls:schedule:change:%d'
+# Past this many changes behind, a process reloads its index instead.
+MAX_REPLAYED_CHANGES = 1000
+# Change that tells every process to reload its index.
+RELOAD = 'reload'
+
+_schedule = None
+_lock = threading.Lock()
+
+
+def record_question(pk, dates):
+    """
+    Log the new ``(pub_date, end_date)`` `dates` of question `pk`.
+
+    `dates` is None for a deleted question. Every process applies the
+    logged changes to its index in place, see ``get_schedule``.
+    """
+    _log_change((pk, dates))
+
+
+def reload_schedules():
+    """Make every process reload its index, after bulk question writes."""
+    _log_change(RELOAD)
+
+
+def _log_change(change):
+    """Append `change` to the schedule log in the cache."""
+    _start_log()
+    seq = cache.incr(SCHEDULE_SEQ_KEY)
+    cache.set(SCHEDULE_CHANGE_KEY % seq, change,
+              settings.POLLS_INDEX_CACHE_TIMEOUT)
+
+
+def get_schedule():
+    """
+    Return the schedule index of the current question list.
+
+    The index is built once per process with one query. Saving or
+    deleting a question (see ``polls.signals``) logs the change in the
+    cache and the next caller of each process sharing it applies the
+    change to a copy of its index, without a query. The index is only
+    reloaded when the log was lost or is too far ahead, after bulk
+    writes, and once it is ``POLLS_INDEX_CACHE_TIMEOUT`` seconds old, so
+    that processes that do not share the cache, such as with the default
+    local memory cache, see the changes made elsewhere. Other requests
+    keep using the old index during such a periodic reload.
+    """
+    global _schedule
+    state = cache.get_many([SCHEDULE_EPOCH_KEY, SCHEDULE_SEQ_KEY])
+    epoch, seq = state.get(SCHEDULE_EPOCH_KEY), state.get(SCHEDULE_SEQ_KEY, 0)
+    schedule = _schedule
+    if _is_current(schedule, epoch, seq):
+        if not _expired(schedule):
+            return schedule
+        if not _lock.acquire(blocking=False):
+            return schedule
+    else:
+        _lock.acquire()
+    try:
+        schedule = _schedule
+        if not _is_current(schedule, epoch, 0) or _expired(schedule):
+            schedule = _load()
+        elif schedule.seq < seq:
+            schedule = _replay(schedule, seq) or _load()
+        _schedule = schedule
+    finally:
+        _lock.release()
+    return schedule
+
+
+def _is_current(schedule, epoch, seq):
+    """Return whether `schedule` has every change up to `seq` of `epoch`."""
+    return schedule is not None and epoch is not None and \
+        schedule.epoch == epoch and schedule.seq >= seq
+
+
+def _expired(schedule):
+    """Return whether `schedule` is due for its periodic reload."""
+    return time.monotonic() - schedule.loaded >= \
+        settings.POLLS_INDEX_CACHE_TIMEOUT
+
+
+def _start_log():
+    """Start a new epoch of the schedule log when it was lost."""
+    if cache.add(SCHEDULE_SEQ_KEY, 0, None):
+        # Every index that knew the old log reloads.
+        cache.set(SCHEDULE_EPOCH_KEY, uuid.uuid4().hex, None)
+
+
+def _load():
+    """Load the index, positioned at the current end of the log."""
+    _start_log()
+    epoch = cache.get(SCHEDULE_EPOCH_KEY)
+    if epoch is None:
+        cache.add(SCHEDULE_EPOCH_KEY, uuid.uuid4().hex, None)
+        epoch = cache.get(SCHEDULE_EPOCH_KEY)
+    return ScheduleIndex.load(epoch, cache.get(SCHEDULE_SEQ_KEY, 0))
+
+
+def _replay(schedule, seq):
+    """Return `schedule` with the changes up to `seq`, None to reload."""
+    if not schedule.seq < seq <= schedule.seq + MAX_REPLAYED_CHANGES:
+        return None
+    keys = [SCHEDULE_CHANGE_KEY % n for n in range(schedule.seq + 1, seq + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys) or RELOAD in changes.values():
+        return None
+    schedule = schedule.copy()
+    for key in keys:
+        pk, dates = changes[key]
+        if dates is None:
+            schedule.remove(pk)
+        else:
+            schedule.update(pk, dates)
+    schedule.seq = seq
+    return schedule
+
+
+def get_schedule_with(question_id):
+    """
+    Return the schedule index, updated if it misses question `question_id`.
+
+    A question added by another process may not be indexed here yet, so
+    the database is checked before the question is taken as missing.
+    """
+    global _schedule
+    schedule = get_schedule()
+    if question_id in schedule:
+        return schedule
+    with use_primary():
+        dates = Question.objects.filter(pk=question_id) \
+            .values_list('pub_date', 'end_date').first()
+    if dates is not None:
+        with _lock:
+            schedule = _schedule.copy()
+            schedule.update(question_id, dates)
+            _schedule = schedule
+    return schedule
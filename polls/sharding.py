@@ -0,0 +1,33 @@
+"""Placement of the vote rows of Django polls application on shards."""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+def shard_for_question(question_id):
+    """
+    Return the database alias holding the votes of one question.
+
+    Questions pinned in ``POLLS_VOTE_SHARD_PINS`` live on their own alias,
+    the others are spread over ``POLLS_VOTE_SHARDS`` by id. Without shards
+    every vote stays in the default database.
+    """
+    pinned = settings.POLLS_VOTE_SHARD_PINS.get(question_id)
+    if pinned:
+        return pinned
+    shards = settings.POLLS_VOTE_SHARDS
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[question_id % len(shards)]
+
+
+def vote_databases():
+    """
+    Return every alias that may hold votes, the default one first.
+
+    Besides the placement targets these are the retired shards of
+    ``POLLS_VOTE_SHARDS_RETIRED``, still holding votes until rebalanced.
+    """
+    aliases = [DEFAULT_DB_ALIAS] + list(settings.POLLS_VOTE_SHARDS) + \
+        list(settings.POLLS_VOTE_SHARD_PINS.values()) + \
+        list(settings.POLLS_VOTE_SHARDS_RETIRED)
+    return list(dict.fromkeys(aliases))
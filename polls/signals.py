@@ -0,0 +1,85 @@
+"""Signal handlers for Django polls application."""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import invalidate_user
+from .cache import drop_snapshots, invalidate_index, \
+    invalidate_question, invalidate_results
+from .models import Choice, Question, Vote
+from .schedule import record_question
+from .sharding import vote_databases
+from .tallies import get_tallies
+
+
+@receiver(post_delete, sender=Vote)
+def discount_deleted_vote(sender, instance, **kwargs):
+    """Keep the choice counter in sync when a vote row is deleted."""
+    Choice.objects.filter(pk=instance.choice_id, vote_count__gt=0).update(
+        vote_count=F('vote_count') - 1)
+    invalidate_results(instance.question_id)
+    tallies = get_tallies()
+    if tallies is not None:
+        transaction.on_commit(lambda: tallies.add({instance.choice_id: -1}))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, signal, **kwargs):
+    """Drop cached data of an edited or deleted question."""
+    invalidate_results(instance.pk)
+    invalidate_question(instance.pk)
+    invalidate_index()
+    record_question(instance.pk, None if signal is post_delete
+                    else (instance.pub_date, instance.end_date))
+
+
+@receiver(post_save, sender=Question)
+def drop_question_snapshot(sender, instance, created, **kwargs):
+    """Drop the results snapshot of an edited question, it may reopen."""
+    if not created:
+        drop_snapshots([instance.pk])
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    """
+    Drop cached data of the question owning an edited choice.
+
+    Only closed questions have a results snapshot to drop.
+    """
+    invalidate_results(instance.question_id)
+    invalidate_question(instance.question_id)
+    try:
+        closed = instance.question.end_date < timezone.now()
+    except Question.DoesNotExist:
+        return
+    if closed:
+        drop_snapshots([instance.question_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Drop the cached row of an edited or deleted user."""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Choice)
+@receiver(post_delete, sender=User)
+def delete_shard_votes(sender, instance, **kwargs):
+    """
+    Cascade deletes to the votes stored on shards.
+
+    Deleting a question, choice or user only cascades to the votes in the
+    default database, the ones on the shards are deleted here.
+    """
+    field = {Question: 'question', Choice: 'choice', User: 'user'}[sender]
+    for alias in vote_databases()[1:]:
+        Vote.objects.using(alias).filter(**{field: instance.pk}).delete()
@@ -0,0 +1,133 @@
+"""Server-Sent Events stream of live results for Django polls application."""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+
+from .cache import get_results
+from .events import RESYNC, get_broker
+from .models import Question
+
+STREAM_PATH = re.compile(r'^/(?:polls/)?(?P<question_id>\d+)/results/stream/$')
+
+
+class ResultsStreamApplication:
+    """
+    ASGI application streaming the results of a question as it is voted.
+
+    ``GET /polls/<id>/results/stream/`` answers with a ``text/event-stream``
+    that starts with a ``snapshot`` event holding the current tallies and
+    then sends a ``delta`` event for every change published on the broker.
+    Every other request goes to the wrapped Django application. The stream
+    is served straight on the event loop, without a thread per client.
+    """
+
+    heartbeat = 15
+    snapshot_attempts = 5
+
+    def __init__(self, application):
+        """Wrap the Django ASGI `application`."""
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        """Serve streams and delegate everything else."""
+        match = STREAM_PATH.match(scope.get('path', '')) \
+            if scope['type'] == 'http' else None
+        if match is None or scope['method'] != 'GET':
+            await self.application(scope, receive, send)
+            return
+        await self.stream(int(match.group('question_id')), receive, send)
+
+    async def stream(self, question_id, receive, send):
+        """
+        Send the event stream of one question until the client leaves.
+
+        The stream subscribes before reading the snapshot, so no change is
+        missed; changes published while the snapshot was read may already
+        be in it, so they are dropped and the snapshot read again.
+        """
+        subscription = get_broker().subscribe(question_id)
+        try:
+            snapshot = await self.consistent_snapshot(question_id,
+                                                      subscription)
+            if snapshot is None:
+                await send({'type': 'http.response.start', 'status': 404,
+                            'headers': [(b'content-type', b'text/plain')]})
+                await send({'type': 'http.response.body',
+                            'body': b'Not Found'})
+                return
+            await self.send_events(subscription, snapshot, receive, send)
+        finally:
+            subscription.close()
+
+    async def send_events(self, subscription, snapshot, receive, send):
+        """Send the snapshot, then the changes until the client leaves."""
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'),
+                                    (b'cache-control', b'no-cache')]})
+            await _send_event(send, 'snapshot', snapshot)
+            while not disconnect.done():
+                message = asyncio.ensure_future(subscription.get())
+                await asyncio.wait({message, disconnect},
+                                   timeout=self.heartbeat,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not message.done():
+                    message.cancel()
+                    if not disconnect.done():
+                        await send({'type': 'http.response.body',
+                                    'body': b': keep-alive\n\n',
+                                    'more_body': True})
+                elif message.result() is RESYNC:
+                    snapshot = await self.consistent_snapshot(
+                        subscription.question_id, subscription)
+                    if snapshot is None:
+                        # The question was deleted, end the stream.
+                        await send({'type': 'http.response.body',
+                                    'body': b''})
+                        return
+                    await _send_event(send, 'snapshot', snapshot)
+                else:
+                    await _send_event(send, 'delta', message.result())
+        finally:
+            disconnect.cancel()
+
+    async def consistent_snapshot(self, question_id, subscription):
+        """
+        Read a snapshot that no queued change of `subscription` overlaps.
+
+        After ``snapshot_attempts`` busy reads the changes queued during
+        the last one are kept, at the risk of counting some twice.
+        """
+        for attempt in range(1, self.snapshot_attempts + 1):
+            snapshot = await sync_to_async(_snapshot)(question_id)
+            if attempt == self.snapshot_attempts or \
+                    not subscription.discard_pending():
+                return snapshot
+
+
+def _snapshot(question_id):
+    """
+    Return the current tally rows of a question, None if it's missing.
+
+    Votes still in the write-behind buffer are left out, they arrive as
+    deltas once flushed.
+    """
+    question = Question.objects.select_related('snapshot') \
+        .filter(pk=question_id).first()
+    return question and {'choices': get_results(question, pending=False)}
+
+
+async def _wait_for_disconnect(receive):
+    """Return once the client closed the connection."""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_event(send, event, data):
+    """Send one Server-Sent Event."""
+    body = 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+    await send({'type': 'http.response.body', 'body': body.encode(),
+                'more_body': True})
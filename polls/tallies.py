@@ -0,0 +1,134 @@
+"""Shared-memory vote counters for Django polls application."""
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count
+
+from .models import Vote
+from .sharding import vote_databases
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SLOT = struct.Struct('<q')
+
+_tallies = None
+_tallies_lock = threading.Lock()
+
+
+class SharedTallies:
+    """
+    Vote counters in a memory-mapped file shared by the workers of a host.
+
+    Slot ``n`` of the file holds the votes of choice ``n`` as a signed
+    64 bit integer; slot 0 holds when the counters were last reconciled
+    with the Vote table, 0 until they are. Increments lock the slot's
+    bytes with ``lockf``, which serializes processes, and a thread lock,
+    which serializes the threads of this process. Reads are not locked.
+    """
+
+    def __init__(self, path, slots):
+        """Map the counters file at `path`, creating it when missing."""
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                'The mmap tally backend needs fcntl, which this platform '
+                'lacks.')
+        self.path = path
+        self.slots = slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = slots * SLOT.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def add(self, deltas):
+        """Add ``{choice_id: amount}`` to the counters it has slots for."""
+        for choice_id, amount in sorted(deltas.items()):
+            if 0 < choice_id < self.slots and amount:
+                offset = choice_id * SLOT.size
+                with self._locked(SLOT.size, offset):
+                    value = SLOT.unpack_from(self._map, offset)[0]
+                    SLOT.pack_into(self._map, offset, value + amount)
+
+    def counts(self, choice_ids):
+        """
+        Return ``{choice_id: votes}`` of `choice_ids`.
+
+        Return None before the first reconcile or when a choice has no slot,
+        the counters cannot be trusted then.
+        """
+        if not self.reconciled_at() or \
+                any(not 0 < pk < self.slots for pk in choice_ids):
+            return None
+        return {pk: SLOT.unpack_from(self._map, pk * SLOT.size)[0]
+                for pk in choice_ids}
+
+    def reconciled_at(self):
+        """Return the time of the last reconcile, 0 if there was none."""
+        return SLOT.unpack_from(self._map, 0)[0]
+
+    def reconcile(self, tallies):
+        """
+        Replace every counter with the ``{choice_id: votes}`` of `tallies`.
+
+        Votes counted by other workers between reading `tallies` and this
+        call are lost until the next reconcile.
+        """
+        counters = bytearray(len(self._map))
+        for choice_id, votes in tallies.items():
+            if 0 < choice_id < self.slots:
+                SLOT.pack_into(counters, choice_id * SLOT.size, votes)
+        SLOT.pack_into(counters, 0, int(time.time()))
+        with self._locked(0, 0):
+            self._map[:] = counters
+
+    def close(self):
+        """Unmap the counters file."""
+        self._map.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _locked(self, length, offset):
+        """Lock `length` bytes of the file at `offset`, 0 for all of it."""
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+
+def count_votes():
+    """Return ``{choice_id: votes}`` counted from the Vote rows."""
+    tallies = Counter()
+    for alias in vote_databases():
+        tallies.update(dict(Vote.objects.using(alias).order_by()
+                            .values_list('choice').annotate(Count('pk'))))
+    return tallies
+
+
+def get_tallies():
+    """
+    Return the shared vote counters, or None when the backend is disabled.
+
+    ``POLLS_TALLY_BACKEND = 'mmap'`` enables them; the file is mapped once
+    per process.
+    """
+    global _tallies
+    if settings.POLLS_TALLY_BACKEND != 'mmap':
+        return None
+    path = str(settings.POLLS_TALLY_FILE)
+    with _tallies_lock:
+        if _tallies is None or _tallies.path != path:
+            _tallies = SharedTallies(path, settings.POLLS_TALLY_SLOTS)
+        return _tallies
@@ -1,10 +1,48 @@
 """Unittests for Django polls application."""
+import asyncio
 import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, \
+    TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from django.utils import timezone
-from .models import Question
+from django.utils.http import http_date
+from .admin import EstimatedCountPaginator
+from .bench import polls_urlconf, seed
+from .buffer import JOURNAL, VoteBuffer
+from .cache import get_question_graph, index_cache_timeout
+from .db import apply_sqlite_pragmas
+from .events import RESYNC, LocalBroker, get_broker
+from .instrumentation import max_queries, registry
+from .management.commands.rebalance_votes import recount
+from .models import Choice, Question, ResultSnapshot, Vote
+from .routers import STICKY_COOKIE, ReplicaRouter, \
+    ReplicaStickinessMiddleware, VoteShardRouter, fresh_replicas, \
+    replica_synced, use_primary
+from .schedule import ScheduleIndex, get_schedule, reload_schedules
+from .sharding import shard_for_question, vote_databases
+from .sse import ResultsStreamApplication
+from .tallies import SharedTallies, get_tallies
+from .throttle import CacheBucketStore, LocalBucketStore
+from .voting import cast_vote, cast_votes_bulk
 from django.urls import reverse
 
 
@@ -94,6 +132,10 @@ class QuestionModelTests(TestCase):
 class QuestionIndexViewTests(TestCase):
     """Class that contains a unittest for index view."""
 
+    def setUp(self):
+        """Start every test without cached index pages."""
+        cache.clear()
+
     def test_no_questions(self):
         """Test app can work with no question."""
         response = self.client.get(reverse('polls:index'))
@@ -138,6 +180,127 @@ class QuestionIndexViewTests(TestCase):
             ['<Question: Past question 2.>', '<Question: Past question 1.>']
         )
 
+    def test_open_flag_is_annotated(self):
+        """Test the index computes voteability in the query."""
+        create_question(question_text="Open question.", days=-5, end_date=5)
+        create_question(question_text="Closed question.",
+                        days=-6, end_date=-1)
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(
+            [(question.question_text, question.is_open)
+             for question in response.context['latest_question_list']],
+            [('Open question.', True), ('Closed question.', False)])
+
+    @override_settings(POLLS_INDEX_PAGE_SIZE=2)
+    def test_keyset_pagination(self):
+        """Test the index pages through the questions with a cursor."""
+        for day in range(5):
+            create_question(question_text="Question %d." % day,
+                            days=-day - 1, end_date=5)
+        url = reverse('polls:index')
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {'after': cursor} if cursor
+                                       else {})
+            seen += [question.question_text for question
+                     in response.context['latest_question_list']]
+            cursor = response.context['view'].next_cursor()
+            if cursor is None:
+                break
+        self.assertEqual(seen, ["Question %d." % day for day in range(5)])
+
+    def test_invalid_cursor(self):
+        """Test a broken cursor gives a 404."""
+        response = self.client.get(reverse('polls:index'), {'after': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_page_is_cached(self):
+        """Test a cached anonymous index page runs no query."""
+        create_question(question_text="Past question.", days=-5, end_date=5)
+        url = reverse('polls:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Past question.")
+
+    def test_question_edit_invalidates_page(self):
+        """Test editing a question drops the cached index page."""
+        question = create_question(question_text="Past question.",
+                                   days=-5, end_date=5)
+        url = reverse('polls:index')
+        self.client.get(url)
+        question.question_text = "Edited question."
+        question.save()
+        self.assertContains(self.client.get(url), "Edited question.")
+
+    def test_cache_timeout_stops_at_next_transition(self):
+        """Test pages expire when the next poll closes."""
+        create_question(question_text="Closing question.",
+                        days=-5, end_date=0.001)
+        self.assertLessEqual(index_cache_timeout(), 87)
+
+    def test_logged_in_page_is_not_page_cached(self):
+        """Test logged in users get their own page and list fragment."""
+        create_question(question_text="Past question.", days=-5, end_date=5)
+        User.objects.create_user(username='voter', password='toey99999')
+        self.client.get(reverse('polls:index'))
+        self.client.login(username='voter', password='toey99999')
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Hello, voter")
+        self.assertContains(response, "Past question.")
+
+
+class ScheduleIndexTests(SimpleTestCase):
+    """Class that contains a unittest for the poll schedule index."""
+
+    def setUp(self):
+        """Index a few questions around a fixed now."""
+        self.now = timezone.now()
+        day = datetime.timedelta(days=1)
+        self.schedule = ScheduleIndex([
+            (1, self.now - 3 * day, self.now - day),
+            (2, self.now - 2 * day, self.now + day),
+            (3, self.now - 2 * day, self.now + 2 * day),
+            (4, self.now + day, self.now + 3 * day),
+        ])
+
+    def test_published_newest_first(self):
+        """Test published questions are paged by (-pub_date, -pk)."""
+        self.assertEqual(self.schedule.published(self.now), [3, 2, 1])
+        self.assertEqual(self.schedule.published(self.now, limit=2), [3, 2])
+        position = self.schedule.dates[3][0], 3
+        self.assertEqual(self.schedule.published(self.now, position), [2, 1])
+
+    def test_state_and_next_transition(self):
+        """Test open/published state and the next opening or closing."""
+        self.assertTrue(self.schedule.is_open(2, self.now))
+        self.assertFalse(self.schedule.is_open(1, self.now))
+        self.assertFalse(self.schedule.is_published(4, self.now))
+        self.assertNotIn(5, self.schedule)
+        self.assertEqual(self.schedule.next_transition(self.now),
+                         self.schedule.dates[2][1])
+        self.assertIsNone(self.schedule.next_transition(
+            self.now + datetime.timedelta(days=4)))
+
+    def test_update_and_remove_in_place(self):
+        """Test edits keep the index sorted without rebuilding it."""
+        day = datetime.timedelta(days=1)
+        self.schedule.update(1, (self.now - 2 * day, self.now + 5 * day))
+        self.schedule.update(5, (self.now - day, self.now + day))
+        self.schedule.remove(3)
+        self.schedule.remove(6)
+        expected = ScheduleIndex([
+            (1, self.now - 2 * day, self.now + 5 * day),
+            (2, self.now - 2 * day, self.now + day),
+            (4, self.now + day, self.now + 3 * day),
+            (5, self.now - day, self.now + day),
+        ])
+        self.assertEqual(self.schedule.dates, expected.dates)
+        self.assertEqual(self.schedule.by_pub_date, expected.by_pub_date)
+        self.assertEqual(self.schedule.transitions, expected.transitions)
+        self.assertEqual(self.schedule.published(self.now), [5, 2, 1])
+
 
 class QuestionDetailViewTests(TestCase):
     """Class that contains a unittest for detail view in django polls app."""
@@ -161,6 +324,1202 @@ class QuestionDetailViewTests(TestCase):
         # self.assertContains(response, past_question.question_text)
         self.assertEqual(response.status_code, 302)
 
+
+class QuestionGraphCacheTests(TestCase):
+    """Class that contains a unittest for the cached question graph."""
+
+    def setUp(self):
+        """Create an open question with two choices."""
+        cache.clear()
+        self.question = create_question(question_text='Cached question.',
+                                        days=-5, end_date=5)
+        self.choices = [self.question.choice_set.create(choice_text=text)
+                        for text in ('Red', 'Blue')]
+        self.url = reverse('polls:detail', args=(self.question.id,))
+
+    def test_detail_served_from_cache(self):
+        """Test the detail page reads the question and choices once."""
+        self.assertContains(self.client.get(self.url), 'Blue')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Red')
+
+    def test_edit_invalidates_graph(self):
+        """Test an edited choice shows up on the next detail page."""
+        self.client.get(self.url)
+        self.choices[1].choice_text = 'Green'
+        self.choices[1].save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Green')
+        self.assertNotContains(response, 'Blue')
+
+    def test_vote_checks_choice_against_graph(self):
+        """Test unknown or malformed choices redisplay the cached form."""
+        user = User.objects.create_user(username='voter')
+        self.client.force_login(user)
+        url = reverse('polls:vote', args=(self.question.id,))
+        for choice in ('999', 'abc'):
+            response = self.client.post(url, {'choice': choice})
+            self.assertContains(response, 'select a choice.')
+            self.assertContains(response, 'Red')
+        self.client.post(url, {'choice': self.choices[0].id})
+        self.assertEqual(Vote.objects.get(user=user).choice, self.choices[0])
+
+    def test_saving_cached_choice_keeps_counter(self):
+        """Test a choice of the graph cache saves without its counter."""
+        get_question_graph(self.question.pk)
+        Choice.objects.filter(pk=self.choices[0].pk).update(vote_count=4)
+        choice = get_question_graph(self.question.pk)[1][0]
+        choice.choice_text = 'Crimson'
+        choice.save()
+        self.assertEqual(choice.vote_count, 4)
+        self.choices[0].refresh_from_db()
+        self.assertEqual((self.choices[0].choice_text,
+                          self.choices[0].vote_count), ('Crimson', 4))
+
+    def test_vote_on_question_the_schedule_missed(self):
+        """Test a question added without invalidating the index is found."""
+        get_schedule()
+        now = timezone.now()
+        with mock.patch('polls.signals.record_question'):
+            question = Question.objects.create(
+                question_text='Added elsewhere.', pub_date=now,
+                end_date=now + datetime.timedelta(days=1))
+        choice = question.choice_set.create(choice_text='Yes')
+        self.client.force_login(User.objects.create_user(username='voter'))
+        response = self.client.post(
+            reverse('polls:vote', args=(question.id,)), {'choice': choice.id})
+        self.assertRedirects(response,
+                             reverse('polls:results', args=(question.id,)))
+        response = self.client.post(reverse('polls:vote', args=(999,)),
+                                    {'choice': choice.id})
+        self.assertEqual(response.status_code, 404)
+
+    def test_question_save_updates_schedule_in_place(self):
+        """Test saved and deleted questions reach the index without a load."""
+        get_schedule()
+        question = create_question(question_text='New.', days=-1,
+                                   end_date=1)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_schedule().is_open(question.pk))
+        question.end_date = timezone.now() - datetime.timedelta(hours=1)
+        question.save()
+        self.assertFalse(get_schedule().is_open(question.pk))
+        question.delete()
+        self.assertNotIn(question.pk, get_schedule())
+        reload_schedules()
+        with self.assertNumQueries(1):
+            get_schedule()
+
+    def test_schedule_expires(self):
+        """Test the schedule index is rebuilt once it is too old."""
+        schedule = get_schedule()
+        self.assertIs(get_schedule(), schedule)
+        with override_settings(POLLS_INDEX_CACHE_TIMEOUT=0):
+            self.assertIsNot(get_schedule(), schedule)
+
+
+class QuestionResultsViewTests(TestCase):
+    """Class that contains a unittest for results view in django polls app."""
+
+    def setUp(self):
+        """Create a question with a few choices and votes."""
+        self.question = create_question(question_text='Results question.',
+                                        days=-5, end_date=5)
+        self.choices = [self.question.choice_set.create(choice_text=str(i))
+                        for i in range(5)]
+        for i in range(3):
+            user = User.objects.create_user(username='voter%d' % i,
+                                            password='toey99999')
+            cast_vote(user, self.question, self.choices[0])
+
+    def test_tallies(self):
+        """Test tallies count the votes of every choice in one query."""
+        with self.assertNumQueries(1):
+            tallies = self.question.tallies()
+        self.assertEqual(tallies[self.choices[0].id], 3)
+        self.assertEqual(tallies[self.choices[1].id], 0)
+
+    def test_results_query_count_does_not_grow_with_choices(self):
+        """Test results page uses a constant number of queries."""
+        url = reverse('polls:results', args=(self.question.id,))
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, '3 vote')
+        self.assertNotContains(response, 'EventSource')
+
+    def test_cached_results_skip_the_tally_query(self):
+        """Test a second results request is served from the cache."""
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, '3 vote')
+
+    def test_choice_edit_invalidates_results(self):
+        """Test editing a choice drops the cached results."""
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        self.choices[0].choice_text = 'Renamed choice'
+        self.choices[0].save()
+        self.assertContains(self.client.get(url), 'Renamed choice')
+
+    def test_conditional_get_answers_not_modified(self):
+        """Test a revalidated results page is a 304 without queries."""
+        url = reverse('polls:results', args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_page_is_not_conditional(self):
+        """Test the detail page, with its CSRF token, is always rendered."""
+        url = reverse('polls:detail', args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('ETag'))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_changes_etag(self):
+        """Test editing a choice changes the results ETag."""
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        self.choices[0].choice_text = 'Renamed choice'
+        self.choices[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ResultSnapshotTests(TestCase):
+    """Class that contains a unittest for results of closed polls."""
+
+    def setUp(self):
+        """Create a closed question with votes."""
+        cache.clear()
+        self.question = create_question(question_text='Closed question.',
+                                        days=-5, end_date=5)
+        self.choices = [self.question.choice_set.create(choice_text=str(i))
+                        for i in range(2)]
+        for i in range(4):
+            user = User.objects.create_user(username='voter%d' % i)
+            cast_vote(user, self.question, self.choices[min(i, 1)])
+        self.question.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.question.save()
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_first_view_takes_snapshot(self):
+        """Test a closed poll is frozen once, then served from one row."""
+        self.assertFalse(ResultSnapshot.objects.exists())
+        response = self.client.get(self.url)
+        self.assertContains(response, '25.0%')
+        self.assertContains(response, '75.0%')
+        snapshot = ResultSnapshot.objects.get(question=self.question)
+        self.assertEqual(snapshot.total_votes, 4)
+        cache.clear()
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, '3 vote')
+
+    def test_snapshot_results_command(self):
+        """Test the command freezes closed polls and skips open ones."""
+        create_question(question_text='Open question.', days=-5, end_date=5)
+        call_command('snapshot_results', stdout=StringIO())
+        self.assertEqual(
+            ResultSnapshot.objects.get().results[1]['votes'], 3)
+        out = StringIO()
+        call_command('snapshot_results', '--refresh', stdout=out)
+        self.assertIn('Took 1 results snapshot(s).', out.getvalue())
+
+    def test_closed_poll_rejects_votes(self):
+        """Test a vote after end_date is refused and changes nothing."""
+        User.objects.create_user(username='late', password='toey99999')
+        self.client.login(username='late', password='toey99999')
+        response = self.client.post(
+            reverse('polls:vote', args=(self.question.id,)),
+            {'choice': self.choices[0].id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertEqual(Vote.objects.count(), 4)
+
+    def test_late_bulk_vote_drops_snapshot(self):
+        """Test the snapshot is taken again after an imported vote."""
+        self.client.get(self.url)
+        user = User.objects.create_user(username='paper ballot')
+        cast_votes_bulk([(user.pk, self.question.pk, self.choices[0].pk)])
+        self.assertFalse(ResultSnapshot.objects.exists())
+        self.assertContains(self.client.get(self.url), '40.0%')
+
+    def test_open_question_keeps_snapshots_alone(self):
+        """Test votes and choice edits of open questions delete nothing."""
+        question = create_question(question_text='Open.', days=-1,
+                                   end_date=5)
+        choice = question.choice_set.create(choice_text='Only choice')
+        user = User.objects.create_user(username='paper ballot')
+        with CaptureQueriesContext(connection) as context:
+            cast_votes_bulk([(user.pk, question.pk, choice.pk)])
+            choice.save()
+        self.assertFalse(any(query['sql'].startswith('DELETE')
+                             for query in context.captured_queries))
+
+
+class ResultsCacheVoteTests(TransactionTestCase):
+    """Class that contains a unittest for results cache invalidation."""
+
+    def test_vote_invalidates_results(self):
+        """Test a committed vote shows up on cached results."""
+        question = create_question(question_text='Live question.',
+                                   days=-5, end_date=5)
+        choice = question.choice_set.create(choice_text='Only choice')
+        url = reverse('polls:results', args=(question.id,))
+        self.assertContains(self.client.get(url), '0 vote')
+        User.objects.create_user(username='voter', password='toey99999')
+        self.client.login(username='voter', password='toey99999')
+        self.client.post(reverse('polls:vote', args=(question.id,)),
+                         {'choice': choice.id})
+        self.assertContains(self.client.get(url), '1 vote')
+
+
+class VoteCounterTests(TestCase):
+    """Class that contains a unittest for the per-choice vote counters."""
+
+    def setUp(self):
+        """Create a question with two choices and a voter."""
+        self.question = create_question(question_text='Counter question.',
+                                        days=-5, end_date=5)
+        self.first = self.question.choice_set.create(choice_text='1')
+        self.second = self.question.choice_set.create(choice_text='2')
+        self.user = User.objects.create_user(username='voter',
+                                             password='toey99999')
+
+    def test_changing_vote_moves_the_count(self):
+        """Test changing a vote decrements the old choice."""
+        self.client.login(username='voter', password='toey99999')
+        url = reverse('polls:vote', args=(self.question.id,))
+        self.client.post(url, {'choice': self.first.id})
+        self.client.post(url, {'choice': self.second.id})
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 0)
+        self.assertEqual(self.second.vote_count, 1)
+
+    def test_revote_keeps_a_single_row(self):
+        """Test voting again updates the existing vote row."""
+        cast_vote(self.user, self.question, self.first)
+        cast_vote(self.user, self.question, self.second)
+        cast_vote(self.user, self.question, self.second)
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 1)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.vote_count, 1)
+
+    def test_deleting_vote_discounts_it(self):
+        """Test deleting a vote row keeps the counter in sync."""
+        cast_vote(self.user, self.question, self.first)
+        Vote.objects.all().delete()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 0)
+
+    def test_rebuild_vote_counts(self):
+        """Test the rebuild command detects and fixes drifted counters."""
+        Vote.objects.create(question=self.question, choice=self.first,
+                            user=self.user)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_vote_counts', '--check', stdout=StringIO())
+        call_command('rebuild_vote_counts', stdout=StringIO())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 1)
+        call_command('rebuild_vote_counts', '--check', stdout=StringIO())
+
+
+class BulkVoteTests(TestCase):
+    """Class that contains a unittest for bulk vote ingestion."""
+
+    def setUp(self):
+        """Create a question, voters and a staff user allowed to import."""
+        self.question = create_question(question_text='Bulk question.',
+                                        days=-5, end_date=5)
+        self.first = self.question.choice_set.create(choice_text='1')
+        self.second = self.question.choice_set.create(choice_text='2')
+        self.other = create_question(question_text='Other question.',
+                                     days=-5, end_date=5) \
+            .choice_set.create(choice_text='other')
+        self.voters = [User.objects.create_user(username='voter%d' % i)
+                       for i in range(3)]
+        staff = User.objects.create_user(username='kiosk',
+                                         password='toey99999')
+        staff.user_permissions.add(
+            Permission.objects.get(codename='add_vote'))
+        self.url = reverse('polls:bulk_vote')
+
+    def test_cast_votes_bulk_outcomes(self):
+        """Test every ballot gets an outcome and counters are updated."""
+        cast_vote(self.voters[0], self.question, self.first)
+        q = self.question.id
+        outcomes = cast_votes_bulk([
+            (self.voters[0].id, q, self.first.id),
+            (self.voters[1].id, q, self.first.id),
+            (self.voters[1].id, q, self.second.id),
+            (self.voters[2].id, q, self.other.id),
+            (0, q, self.first.id),
+        ])
+        self.assertEqual(outcomes, ['unchanged', 'created', 'changed',
+                                    'invalid choice', 'unknown user'])
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 1)
+        self.assertEqual(self.second.vote_count, 1)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_cast_votes_bulk_moves_votes_between_choices(self):
+        """Test a bulk ballot can move a vote cast earlier."""
+        cast_vote(self.voters[0], self.question, self.first)
+        self.assertEqual(cast_votes_bulk(
+            [(self.voters[0].id, self.question.id, self.second.id)]),
+            ['changed'])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 0)
+
+    def test_bulk_vote_requires_permission(self):
+        """Test a user without permission can't import ballots."""
+        User.objects.create_user(username='plain', password='toey99999')
+        self.client.login(username='plain', password='toey99999')
+        response = self.client.post(self.url, '[]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_vote_json(self):
+        """Test ballots posted as JSON are recorded."""
+        self.client.login(username='kiosk', password='toey99999')
+        ballots = [{'user': voter.username, 'question': self.question.id,
+                    'choice': self.second.id} for voter in self.voters]
+        ballots.append({'user': 'voter0'})
+        response = self.client.post(self.url, json.dumps(ballots),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['summary'],
+                         {'created': 3, 'malformed row': 1})
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.vote_count, 3)
+
+    def test_bulk_vote_csv(self):
+        """Test ballots posted as CSV are recorded."""
+        self.client.login(username='kiosk', password='toey99999')
+        body = 'user,question,choice\nvoter1,%d,%d\n' % (
+            self.question.id, self.first.id)
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.json()['results'],
+                         [{'row': 0, 'status': 'created'}])
+
+    def test_bulk_vote_refuses_closed_polls_and_missing_users(self):
+        """Test ballots without a user or for a closed poll are refused."""
+        self.client.login(username='kiosk', password='toey99999')
+        closed = create_question(question_text='Closed question.',
+                                 days=-5, end_date=-1)
+        late = closed.choice_set.create(choice_text='late')
+        ballots = [
+            {'question': self.question.id, 'choice': self.first.id},
+            {'user': None, 'question': self.question.id,
+             'choice': self.first.id},
+            {'user': 'voter0', 'question': closed.id, 'choice': late.id},
+            {'user': 'voter1', 'question': self.question.id,
+             'choice': self.first.id},
+        ]
+        response = self.client.post(self.url, json.dumps(ballots),
+                                    content_type='application/json')
+        self.assertEqual([row['status'] for row in response.json()['results']],
+                         ['malformed row', 'malformed row', 'closed poll',
+                          'created'])
+        self.assertFalse(Vote.objects.filter(question=closed).exists())
+
+
+class ImportPollsTests(TestCase):
+    """Class that contains a unittest for the bulk poll import."""
+
+    def write(self, name, content):
+        """Write an import file, return its path."""
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as import_file:
+            import_file.write(content)
+        return path
+
+    def setUp(self):
+        """Make a directory for the import files."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_import_json(self):
+        """Test questions and choices are created with their ids."""
+        path = self.write('polls.json', json.dumps({'questions': [
+            {'question_text': 'Lunch?', 'pub_date': '2026-01-05T09:00:00',
+             'end_date': '2026-01-06T09:00:00+07:00',
+             'choices': ['Rice', 'Noodles']},
+            {'question_text': 'Dinner?', 'pub_date': '2026-01-05T09:00:00',
+             'end_date': '2026-01-07T09:00:00', 'choices': ['Soup']},
+        ]}))
+        call_command('import_polls', path, '--batch-size', '1',
+                     stdout=StringIO())
+        lunch = Question.objects.get(question_text='Lunch?')
+        self.assertEqual(
+            list(lunch.choice_set.values_list('choice_text', flat=True)),
+            ['Rice', 'Noodles'])
+        self.assertEqual(lunch.end_date.isoformat(),
+                         '2026-01-06T02:00:00+00:00')
+        self.assertEqual(Question.objects.get(
+            question_text='Dinner?').choice_set.count(), 1)
+
+    def test_import_csv_with_synthetic_votes(self):
+        """Test a CSV import can seed users and votes for load tests."""
+        path = self.write('polls.csv',
+                          'question_text,pub_date,end_date,choices\n'
+                          'Exam?,2026-01-01 08:00,2026-02-01 08:00,'
+                          'Mon|Tue|Wed\n')
+        call_command('import_polls', path, '--synthetic-users', '5',
+                     '--synthetic-votes', '4', stdout=StringIO())
+        self.assertEqual(Choice.objects.count(), 3)
+        self.assertEqual(Vote.objects.count(), 4)
+        call_command('rebuild_vote_counts', '--check', stdout=StringIO())
+
+    def test_invalid_polls_import_nothing(self):
+        """Test a file with an invalid poll is rejected as a whole."""
+        path = self.write('polls.yaml', """
+- question_text: Fine?
+  pub_date: 2026-01-01 08:00
+  end_date: 2026-01-02 08:00
+  choices: [Yes]
+- question_text: Backwards?
+  pub_date: 2026-01-02 08:00
+  end_date: 2026-01-01 08:00
+  choices: [Yes]
+""")
+        with self.assertRaisesMessage(CommandError, 'Poll 2: pub_date '
+                                                    'must be before end_date'):
+            call_command('import_polls', path, stdout=StringIO())
+        self.assertFalse(Question.objects.exists())
+
+
+class AdminTests(TestCase):
+    """Class that contains a unittest for the polls admin pages."""
+
+    def setUp(self):
+        """Create questions with votes and log a superuser in."""
+        for n in range(3):
+            question = create_question(question_text='Admin question %d.' % n,
+                                       days=-5, end_date=5)
+            choice = question.choice_set.create(choice_text='Yes')
+            for i in range(n):
+                cast_vote(User.objects.get_or_create(
+                    username='voter%d' % i)[0], question, choice)
+        admin = User.objects.create_superuser('admin', 'admin@ku.th',
+                                              'toey99999')
+        self.client.force_login(admin)
+
+    def test_question_changelist_shows_vote_totals(self):
+        """Test total votes come from one annotated query."""
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse('admin:polls_question_changelist'))
+        self.assertContains(response, '<td class="field-total_votes">2</td>',
+                            html=True)
+
+    def test_vote_changelist_joins_related_rows(self):
+        """Test the vote list does not query per row."""
+        url = reverse('admin:polls_vote_changelist')
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, 'Admin question 2.')
+
+    def test_question_search_skips_full_count(self):
+        """Test a search matches substrings and counts the table once."""
+        url = reverse('admin:polls_question_changelist')
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'q': 'question 1'})
+        self.assertContains(response, 'Admin question 1.')
+        self.assertNotContains(response, 'Admin question 2.')
+
+    def test_estimated_count_paginator(self):
+        """Test lists without a planner estimate are counted exactly."""
+        Vote.objects.order_by('pk').first().delete()
+        paginator = EstimatedCountPaginator(Vote.objects.order_by('pk'), 100)
+        paginator.exact_below = 0
+        self.assertEqual(paginator.count, 2)
+        paginator = EstimatedCountPaginator(
+            Vote.objects.filter(choice__choice_text='Yes').order_by('pk'), 100)
+        self.assertEqual(paginator.count, 2)
+
+
+class ExportTests(TestCase):
+    """Class that contains a unittest for the streaming exports."""
+
+    def setUp(self):
+        """Create a question with votes and a staff user allowed to export."""
+        cache.clear()
+        self.question = create_question(question_text='Exported question.',
+                                        days=-5, end_date=5)
+        self.choice = self.question.choice_set.create(choice_text='Yes, "1"')
+        for i in range(3):
+            cast_vote(User.objects.create_user(username='voter%d' % i),
+                      self.question, self.choice)
+        staff = User.objects.create_user(username='staff',
+                                         password='toey99999')
+        staff.user_permissions.add(
+            Permission.objects.get(codename='view_vote'))
+        self.client.login(username='staff', password='toey99999')
+
+    def url(self, kind, fmt):
+        """Return the export url of the question."""
+        return reverse('polls:export', args=(self.question.id, kind, fmt))
+
+    def test_votes_csv(self):
+        """Test the votes stream as CSV rows with usernames."""
+        response = self.client.get(self.url('votes', 'csv'))
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0],
+                         'vote_id,user_id,username,choice_id,choice_text')
+        self.assertEqual(len(rows), 4)
+        self.assertIn('voter0,%d,"Yes, ""1"""' % self.choice.id, rows[1])
+
+    def test_results_json_gzip(self):
+        """Test the results stream as gzipped JSON when accepted."""
+        response = self.client.get(self.url('results', 'json'),
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(
+            b''.join(response.streaming_content)))
+        self.assertEqual(data, [{'choice_id': self.choice.id,
+                                 'choice_text': 'Yes, "1"',
+                                 'votes': 3, 'percent': 100.0}])
+
+    def test_export_needs_permission(self):
+        """Test voters cannot export and unknown formats are 404."""
+        self.assertEqual(
+            self.client.get(self.url('votes', 'xml')).status_code, 404)
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(self.url('votes', 'csv')).status_code, 403)
+
+    def test_export_command(self):
+        """Test the command writes the gzipped export to a file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.json.gz')
+            call_command('export_question', self.question.id,
+                         '--format', 'json', '--gzip', '--output', path)
+            with gzip.open(path) as export:
+                self.assertEqual(len(json.load(export)), 3)
+
+
+class VoteBufferTests(TestCase):
+    """Class that contains a unittest for the write-behind vote buffer."""
+
+    def setUp(self):
+        """Create a question with two choices and two voters."""
+        self.question = create_question(question_text='Buffered question.',
+                                        days=-5, end_date=5)
+        self.first = self.question.choice_set.create(choice_text='1')
+        self.second = self.question.choice_set.create(choice_text='2')
+        self.users = [User.objects.create_user(username='voter%d' % i)
+                      for i in range(2)]
+
+    def test_flush_coalesces_ballots(self):
+        """Test only the last ballot of a user is written."""
+        buffer = VoteBuffer()
+        buffer.add(self.users[0].id, self.question.id, self.first.id)
+        buffer.add(self.users[0].id, self.question.id, self.second.id)
+        buffer.add(self.users[1].id, self.question.id, self.second.id)
+        self.assertEqual(buffer.flush(), 2)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.vote_count, 2)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_overlay_counts_pending_ballots(self):
+        """Test results include ballots that are not written yet."""
+        cast_vote(self.users[0], self.question, self.first)
+        buffer = VoteBuffer()
+        buffer.add(self.users[0].id, self.question.id, self.second.id)
+        buffer.add(self.users[1].id, self.question.id, self.second.id)
+        rows = [{'id': self.first.id, 'votes': 1},
+                {'id': self.second.id, 'votes': 0}]
+        self.assertEqual([row['votes'] for row in
+                          buffer.overlay(self.question.id, rows)], [0, 2])
+
+    def test_journal_is_replayed(self):
+        """Test journaled ballots survive a lost buffer."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.log')
+            crashed = VoteBuffer(durability=JOURNAL, journal_path=path)
+            crashed.add(self.users[0].id, self.question.id, self.first.id)
+            recovered = VoteBuffer(durability=JOURNAL, journal_path=path)
+            self.assertEqual(recovered.flush(), 1)
+            recovered.stop()
+            crashed.stop()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.vote_count, 1)
+
+    def test_journals_of_exited_workers_are_replayed(self):
+        """Test a buffer claims the journals of exited processes only."""
+        exited = multiprocessing.get_context('fork').Process(target=int)
+        exited.start()
+        exited.join()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.log')
+            for pid, user in ((exited.pid, self.users[0]),
+                              (os.getppid(), self.users[1])):
+                with open('%s.%d' % (path, pid), 'w') as journal:
+                    journal.write('%d,%d,%d\n' % (
+                        user.id, self.question.id, self.first.id))
+            buffer = VoteBuffer(durability=JOURNAL, journal_path=path)
+            self.assertEqual(buffer.pending_for(self.question.id),
+                             {self.users[0].id: self.first.id})
+            self.assertEqual(set(os.listdir(directory)), {
+                'votes.log.%d' % os.getpid(),
+                'votes.log.%d' % os.getppid()})
+            buffer.stop()
+
+    def test_failed_flush_keeps_newer_ballot(self):
+        """Test a ballot journaled during a failed flush wins on replay."""
+        user_id, question_id = self.users[0].id, self.question.id
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.log')
+            buffer = VoteBuffer(durability=JOURNAL, journal_path=path)
+            buffer.add(user_id, question_id, self.first.id)
+
+            def fail(ballots):
+                buffer.add(user_id, question_id, self.second.id)
+                raise OperationalError('database is locked')
+
+            with mock.patch('polls.voting.cast_votes_bulk', fail), \
+                    self.assertLogs('polls.buffer', 'ERROR'), \
+                    self.assertRaises(OperationalError):
+                buffer.flush()
+            recovered = VoteBuffer(durability=JOURNAL, journal_path=path)
+            for pending in (buffer, recovered):
+                self.assertEqual(pending.pending_for(question_id),
+                                 {user_id: self.second.id})
+            recovered.stop()
+            buffer.stop()
+
+    def test_unknown_users_are_counted(self):
+        """Test ballots that cannot be written are logged, not lost quietly."""
+        buffer = VoteBuffer()
+        buffer.add(0, self.question.id, self.first.id)
+        with self.assertLogs('polls.buffer', 'WARNING'):
+            buffer.flush()
+        self.assertEqual(buffer.dropped, 1)
+
+
+def add_tallies(path, choice_id, times):
+    """Increment one shared counter `times` times, in a child process."""
+    tallies = SharedTallies(path, 16)
+    for _ in range(times):
+        tallies.add({choice_id: 1})
+
+
+class SharedTalliesTests(TestCase):
+    """Class that contains a unittest for the mmap tally backend."""
+
+    def setUp(self):
+        """Create a question with two choices and a counters file."""
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tallies.bin')
+        self.question = create_question(question_text='Shared question.',
+                                        days=-5, end_date=5)
+        self.first = self.question.choice_set.create(choice_text='1')
+        self.second = self.question.choice_set.create(choice_text='2')
+
+    def test_increments_from_processes(self):
+        """Test concurrent increments of several processes all count."""
+        tallies = SharedTallies(self.path, 16)
+        self.addCleanup(tallies.close)
+        self.assertIsNone(tallies.counts([3]))
+        tallies.reconcile({3: 5, 20: 1})
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=add_tallies,
+                                   args=(self.path, 3, 200))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(tallies.counts([3]), {3: 805})
+        self.assertIsNone(tallies.counts([3, 20]))
+
+    def test_results_read_shared_counters(self):
+        """Test results come from the counters once they are reconciled."""
+        user = User.objects.create_user(username='voter')
+        with override_settings(POLLS_TALLY_BACKEND='mmap',
+                               POLLS_TALLY_FILE=self.path):
+            with self.captureOnCommitCallbacks(execute=True):
+                cast_vote(user, self.question, self.first)
+            call_command('reconcile_tallies', stdout=StringIO())
+            with self.captureOnCommitCallbacks(execute=True):
+                cast_vote(user, self.question, self.second)
+            Choice.objects.update(vote_count=0)
+            url = reverse('polls:results', args=(self.question.id,))
+            response = self.client.get(url)
+        self.assertEqual([row['votes'] for row in response.context['choices']],
+                         [0, 1])
+
+    def test_rebalanced_votes_keep_shared_counts(self):
+        """Test moved votes still count, the stale copies do not."""
+        users = [User.objects.create_user(username=name)
+                 for name in ('moved', 'stale')]
+        with override_settings(POLLS_TALLY_BACKEND='mmap',
+                               POLLS_TALLY_FILE=self.path):
+            for user in users:
+                cast_vote(user, self.question, self.first)
+            call_command('reconcile_tallies', stdout=StringIO())
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    Vote.objects.all().delete()
+                    recount({self.first.pk: 1})
+            counts = get_tallies().counts([self.first.pk])
+        self.assertEqual(counts, {self.first.pk: 1})
+
+    def test_needs_fcntl(self):
+        """Test the backend refuses to start without fcntl."""
+        with mock.patch('polls.tallies.fcntl', None), \
+                self.assertRaises(ImproperlyConfigured):
+            SharedTallies(self.path, 16)
+
+
+class VoteThrottleTests(TestCase):
+    """Class that contains a unittest for vote throttling."""
+
+    def setUp(self):
+        """Log a voter in on an open question, with empty buckets."""
+        patcher = mock.patch('polls.throttle._store', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.question = create_question(question_text='Throttled question.',
+                                        days=-5, end_date=5)
+        self.choice = self.question.choice_set.create(choice_text='1')
+        self.client.force_login(User.objects.create_user(username='voter'))
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_bucket_refills(self):
+        """Test a bucket lets its capacity through, then asks to wait."""
+        for store in (LocalBucketStore(), CacheBucketStore()):
+            cache.clear()
+            self.assertEqual(store.take([('key', 2, 60)]), 0)
+            self.assertEqual(store.take([('key', 2, 60)]), 0)
+            self.assertAlmostEqual(store.take([('key', 2, 60)]), 30,
+                                   places=0)
+            self.assertEqual(store.take([('other', 2, 60)]), 0)
+
+    def test_refused_vote_takes_no_token(self):
+        """Test a vote refused by one bucket leaves the others alone."""
+        for store in (LocalBucketStore(), CacheBucketStore()):
+            cache.clear()
+            self.assertEqual(store.take([('user', 1, 60)]), 0)
+            self.assertAlmostEqual(
+                store.take([('ip', 1, 10), ('user', 1, 60)]), 60, places=0)
+            self.assertEqual(store.take([('ip', 1, 10)]), 0)
+
+    def test_least_recently_used_bucket_dropped(self):
+        """Test the store keeps at most max_keys buckets, LRU first out."""
+        store = LocalBucketStore(max_keys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            store.take([(key, 1, 60)])
+        self.assertEqual(list(store._buckets), ['a', 'c'])
+
+    @override_settings(POLLS_VOTE_THROTTLE={'ip': (1, 60)},
+                       POLLS_THROTTLE_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_ip_from_configured_header(self):
+        """Test clients behind a proxy are told apart by the header."""
+        for client_ip in ('10.0.0.1', '10.0.0.2'):
+            response = self.client.post(
+                self.url, {'choice': self.choice.id},
+                HTTP_X_FORWARDED_FOR='1.2.3.4, %s' % client_ip)
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(self.url, {'choice': self.choice.id},
+                                    HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(POLLS_VOTE_THROTTLE={'user': (1, 60)})
+    def test_over_rate_gets_429(self):
+        """Test a vote over the rate is refused before any other query."""
+        response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 302)
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url,
+                                        {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_same_choice_writes_nothing(self):
+        """Test resubmitting the held choice only reads."""
+        self.client.post(self.url, {'choice': self.choice.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url,
+                                        {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results',
+                                               args=(self.question.id,)))
+        self.assertTrue(all(query['sql'].startswith('SELECT')
+                            for query in queries))
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.vote_count, 1)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+    AUTHENTICATION_BACKENDS=['polls.auth.CachedModelBackend'])
+class CachedSessionTests(TestCase):
+    """Class that contains a unittest for cookie sessions and cached auth."""
+
+    def setUp(self):
+        """Log a voter in on an open question."""
+        cache.clear()
+        self.question = create_question(question_text='Session question.',
+                                        days=-5, end_date=5)
+        self.choice = self.question.choice_set.create(choice_text='1')
+        self.user = User.objects.create_user(username='voter')
+        self.client.force_login(self.user)
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_skips_session_and_user_queries(self):
+        """Test a repeated vote only reads the vote it already holds."""
+        self.client.post(self.url, {'choice': self.choice.id})
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url,
+                                        {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 302)
+
+    def test_deactivated_user_is_logged_out(self):
+        """Test saving the user drops the cached row."""
+        self.client.post(self.url, {'choice': self.choice.id})
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+
+class ResultsStreamTests(TestCase):
+    """Class that contains a unittest for the live results stream."""
+
+    def test_local_broker_delivers_to_subscribers(self):
+        """Test a published message reaches the question's subscribers."""
+        async def exchange():
+            broker = LocalBroker()
+            subscription = broker.subscribe(1)
+            other = broker.subscribe(2)
+            broker.publish(1, {'deltas': {3: 1}})
+            message = await subscription.get()
+            subscription.close()
+            other.close()
+            return message, other.queue.empty()
+
+        self.assertEqual(async_to_sync(exchange)(),
+                         ({'deltas': {3: 1}}, True))
+
+    def test_stream_sends_snapshot_then_deltas(self):
+        """Test the stream starts with the tallies and follows changes."""
+        question = create_question(question_text='Live question.',
+                                   days=-5, end_date=5)
+        choice = question.choice_set.create(choice_text='Only choice')
+        sent = []
+        done = asyncio.Event()
+
+        async def receive():
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            body = message.get('body', b'')
+            if body.startswith(b'event: snapshot'):
+                get_broker().publish(question.id, {'deltas': {choice.id: 1}})
+            elif body.startswith(b'event: delta'):
+                done.set()
+
+        app = ResultsStreamApplication(None)
+        scope = {'type': 'http', 'method': 'GET',
+                 'path': '/polls/%d/results/stream/' % question.id}
+        async_to_sync(app)(scope, receive, send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'"votes": 0', sent[1]['body'])
+        self.assertIn(b'"deltas": {"%d": 1}' % choice.id, sent[2]['body'])
+
+    def test_stream_ends_when_question_deleted(self):
+        """Test a resync of a deleted question ends the stream."""
+        sent = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        async def stream():
+            subscription = LocalBroker().subscribe(1)
+            subscription.queue.put_nowait(RESYNC)
+            app = ResultsStreamApplication(None)
+            await app.send_events(subscription, {'choices': []}, receive,
+                                  send)
+            subscription.close()
+
+        with mock.patch('polls.sse._snapshot', return_value=None):
+            async_to_sync(stream)()
+        self.assertEqual(len(sent), 3)
+        self.assertFalse(sent[-1].get('more_body'))
+
+    def test_snapshot_retried_after_overlapping_change(self):
+        """Test a change published during the snapshot is not sent twice."""
+        broker = LocalBroker()
+        snapshots = iter([{'choices': 'old'}, {'choices': 'new'}])
+
+        def snapshot(question_id):
+            broker.publish(question_id, {'deltas': {1: 1}})
+            return next(snapshots)
+
+        async def read():
+            subscription = broker.subscribe(1)
+            app = ResultsStreamApplication(None)
+            app.snapshot_attempts = 2
+            result = await app.consistent_snapshot(1, subscription)
+            subscription.close()
+            return result, subscription.queue.qsize()
+
+        with mock.patch('polls.sse._snapshot', snapshot):
+            self.assertEqual(async_to_sync(read)(), ({'choices': 'new'}, 1))
+
+
+@override_settings(ROOT_URLCONF=polls_urlconf(True))
+class AsyncViewTests(TestCase):
+    """Class that contains a unittest for the async views."""
+
+    def setUp(self):
+        """Create an open question, a voter and an async client."""
+        self.question = create_question(question_text='Async question.',
+                                        days=-5, end_date=5)
+        self.choice = self.question.choice_set.create(choice_text='Yes')
+        User.objects.create_user(username='voter', password='toey99999')
+        self.client = AsyncClient()
+
+    def get(self, url, **extra):
+        """Send a GET request through the ASGI handler."""
+        return async_to_sync(self.client.get)(url, **extra)
+
+    def test_results(self):
+        """Test the async results page renders and revalidates."""
+        url = reverse('polls:results', args=(self.question.id,))
+        with override_settings(POLLS_ASYNC_VIEWS=True):
+            response = self.get(url)
+        self.assertContains(response, '0 vote')
+        self.assertContains(response, 'EventSource')
+        response = self.get(url, **{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        with mock.patch('polls.views.question_version',
+                        side_effect=AssertionError('sync ORM in async')):
+            self.assertEqual(self.get(url).status_code, 200)
+
+    def test_detail_and_index(self):
+        """Test the async detail and index pages render."""
+        self.assertContains(
+            self.get(reverse('polls:detail', args=(self.question.id,))),
+            'Async question.')
+        self.assertContains(self.get(reverse('polls:index')),
+                            'Async question.')
+
+    def test_vote(self):
+        """Test the async vote view needs a login and records the vote."""
+        url = reverse('polls:vote', args=(self.question.id,))
+        form = 'choice=%d' % self.choice.id
+
+        def vote():
+            return async_to_sync(self.client.post)(
+                url, form, content_type='application/x-www-form-urlencoded')
+
+        self.assertEqual(vote().status_code, 302)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.client.login(username='voter', password='toey99999')
+        vote()
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.vote_count, 1)
+        with mock.patch('polls.throttle._store', None), \
+                override_settings(POLLS_VOTE_THROTTLE={'ip': (1, 10)}):
+            self.assertEqual(vote().status_code, 302)
+            self.assertEqual(vote().status_code, 429)
+
+
+class BenchmarkSeedTests(TestCase):
+    """Class that contains a unittest for the benchmark data seeding."""
+
+    def test_seed_keeps_counters_consistent(self):
+        """Test seeded votes and counters agree."""
+        graph, user_ids = seed(questions=5, choices=3, users=4, votes=15,
+                               seed=1)
+        self.assertEqual(len(graph), 5)
+        self.assertEqual(len(user_ids), 4)
+        self.assertEqual(Vote.objects.count(), 15)
+        call_command('rebuild_vote_counts', '--check', stdout=StringIO())
+
+
+@override_settings(
+    POLLS_INSTRUMENTATION=True,
+    MIDDLEWARE=['polls.instrumentation.InstrumentationMiddleware'] +
+    settings.MIDDLEWARE)
+class InstrumentationTests(TestCase):
+    """Class that contains a unittest for the instrumentation middleware."""
+
+    def setUp(self):
+        """Create a question and start from empty metrics."""
+        registry.clear()
+        cache.clear()
+        self.question = create_question(question_text='Timed question.',
+                                        days=-5, end_date=5)
+
+    def test_server_timing_header(self):
+        """Test responses report their query count and timings."""
+        response = self.client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('3 queries', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        """Test the totals per view are published for Prometheus."""
+        self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.client.get(reverse('polls:metrics'))
+                         .status_code, 403)
+        self.client.force_login(User.objects.create_user(
+            username='staff', is_staff=True))
+        response = self.client.get(reverse('polls:metrics'))
+        self.assertContains(
+            response, 'polls_view_requests_total{view="polls:results"} 2')
+        self.assertContains(response, '# TYPE polls_view_queries_total '
+                                      'counter')
+
+    @override_settings(POLLS_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test scrapers can read the metrics with the bearer token."""
+        url = reverse('polls:metrics')
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_max_queries(self):
+        """Test the query budget helper fails over budget."""
+        with max_queries(1):
+            Question.objects.count()
+        with self.assertRaises(AssertionError):
+            with max_queries(1):
+                Question.objects.count()
+                Question.objects.count()
+
+
+class SqlitePragmaTests(TestCase):
+    """Class that contains a unittest for the SQLite connection setup."""
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -4000})
+    def test_pragmas_are_applied(self):
+        """Test the configured PRAGMAs run on a connection."""
+        apply_sqlite_pragmas(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -4000)
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size; DROP': 1})
+    def test_invalid_pragma(self):
+        """Test a malformed PRAGMA is refused."""
+        with self.assertRaises(ValueError):
+            apply_sqlite_pragmas(None, connection)
+
+
+@override_settings(POLLS_READ_REPLICAS=['replica'], POLLS_REPLICA_MAX_LAG=5,
+                   POLLS_REPLICA_STICKY_SECONDS=15)
+class ReplicaRouterTests(SimpleTestCase):
+    """Class that contains unittests for the read replica routing."""
+
+    def setUp(self):
+        """Start every test with a fresh cache."""
+        cache.clear()
+        self.router = ReplicaRouter()
+
+    def test_fresh_replica_takes_reads(self):
+        """Test polls reads go to a replica that synced recently."""
+        replica_synced('replica')
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        """Test reads go to the primary when the replica lags."""
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+        replica_synced('replica', time.time() - 60)
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_writer_is_pinned_to_primary(self):
+        """Test a client that just voted reads its own vote."""
+        replica_synced('replica')
+        seen = []
+        middleware = ReplicaStickinessMiddleware(lambda request: seen.append(
+            self.router.db_for_read(Question)) or HttpResponse())
+        factory = RequestFactory()
+        response = middleware(factory.post('/polls/1/vote/'))
+        self.assertEqual(seen, ['default'])
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 15)
+        request = factory.get('/polls/1/results/')
+        request.COOKIES[STICKY_COOKIE] = cookie.value
+        middleware(request)
+        middleware(factory.get('/polls/1/results/'))
+        self.assertEqual(seen, ['default', 'default', 'replica'])
+
+    def test_cache_fills_read_the_primary(self):
+        """Test reads filling a shared cache skip a fresh replica."""
+        replica_synced('replica')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+
+    def test_replica_picked_once_per_request(self):
+        """Test the reads of one request look the lag up once."""
+        replica_synced('replica')
+        seen = []
+
+        def view(request):
+            with mock.patch('polls.routers.fresh_replicas',
+                            wraps=fresh_replicas) as lookup:
+                seen.append(self.router.db_for_read(Question))
+                seen.append(self.router.db_for_read(Choice))
+            seen.append(lookup.call_count)
+            return HttpResponse()
+        ReplicaStickinessMiddleware(view)(RequestFactory().get('/polls/'))
+        self.assertEqual(seen, ['replica', 'replica', 1])
+
+
+@override_settings(POLLS_VOTE_SHARDS=['votes1', 'votes2'],
+                   POLLS_VOTE_SHARD_PINS={7: 'votes_hot'},
+                   POLLS_VOTE_SHARDS_RETIRED=['votes_old'])
+class VoteShardTests(SimpleTestCase):
+    """Class that contains unittests for the vote shard placement."""
+
+    def test_placement(self):
+        """Test questions spread over the shards, pins win."""
+        self.assertEqual(shard_for_question(4), 'votes1')
+        self.assertEqual(shard_for_question(5), 'votes2')
+        self.assertEqual(shard_for_question(7), 'votes_hot')
+        self.assertEqual(vote_databases(), ['default', 'votes1', 'votes2',
+                                            'votes_hot', 'votes_old'])
+
+    def test_router_follows_hints(self):
+        """Test votes reached from a question or a vote use its shard."""
+        router = VoteShardRouter()
+        question = Question(pk=5)
+        self.assertEqual(router.db_for_read(Vote, instance=question),
+                         'votes2')
+        self.assertEqual(router.db_for_write(Vote, instance=Vote(
+            question_id=7)), 'votes_hot')
+        self.assertIsNone(router.db_for_read(Vote))
+        self.assertIsNone(router.db_for_read(Question, instance=question))
+        self.assertEqual(Vote.objects.for_question(4).db, 'votes1')
+
+
 # Response Codes:1xx Information100 Continue
 # 2xx Success200 OK
 # 201 Created (a new resource was successfully created)
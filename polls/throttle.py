@@ -0,0 +1,173 @@
+"""Token bucket throttling of votes for Django polls application."""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+THROTTLE_KEY = 'polls:throttle:%s:%s'
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class LocalBucketStore:
+    """
+    Token buckets kept in the memory of this process.
+
+    Fast, but each worker process throttles on its own. Past `max_keys`
+    buckets the least recently used one is dropped.
+    """
+
+    def __init__(self, max_keys=100000):
+        """Create an empty store."""
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """
+        Take a token from every bucket if each has one, return the wait.
+
+        `buckets` holds ``(key, capacity, period)`` triples: the bucket
+        `key` holds up to `capacity` tokens and refills `capacity` tokens
+        every `period` seconds. Return 0 when the tokens were taken, else
+        the seconds until every bucket has one again; no token is taken
+        then.
+        """
+        now = time.monotonic()
+        with self._lock:
+            refilled = {key: _refill(self._buckets.get(key, (capacity, now)),
+                                     now, capacity, period)
+                        for key, capacity, period in buckets}
+            wait = _wait(refilled.values())
+            for key, (tokens, _) in refilled.items():
+                self._buckets[key] = tokens - (0 if wait else 1), now
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Token buckets kept in the default cache, shared by every worker.
+
+    The read and write of the buckets are not atomic, so concurrent
+    requests of one client may take a few tokens more than it holds.
+    """
+
+    def take(self, buckets):
+        """Take a token from every bucket, see ``LocalBucketStore.take``."""
+        now = time.time()
+        stored = cache.get_many([key for key, _, _ in buckets])
+        refilled = {key: _refill(stored.get(key, (capacity, now)), now,
+                                 capacity, period)
+                    for key, capacity, period in buckets}
+        wait = _wait(refilled.values())
+        if not wait:
+            for key, capacity, period in buckets:
+                tokens, _ = refilled[key]
+                cache.set(key, (tokens - 1, now), math.ceil(period))
+        return wait
+
+
+def _refill(bucket, now, capacity, period):
+    """Return the ``(tokens, seconds per token)`` of a bucket at `now`."""
+    tokens, updated = bucket
+    rate = capacity / period
+    return min(capacity, tokens + max(now - updated, 0) * rate), 1 / rate
+
+
+def _wait(refilled):
+    """Return the seconds until every refilled bucket holds a token."""
+    return max(((1 - tokens) * per_token for tokens, per_token in refilled
+                if tokens < 1), default=0)
+
+
+def get_store():
+    """Return the bucket store configured by ``POLLS_THROTTLE_STORE``."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = import_string(settings.POLLS_THROTTLE_STORE)()
+        return _store
+
+
+def vote_wait(request, question_id):
+    """
+    Return the seconds before a vote of `request` may go through, 0 if now.
+
+    Every ``scope: (votes, seconds)`` of ``POLLS_VOTE_THROTTLE`` is a token
+    bucket per client IP (``ip``), logged in user (``user``) or question
+    (``question``); a vote takes a token from each or from none. The IP is
+    read from the ``POLLS_THROTTLE_IP_HEADER`` request header. The user
+    comes from the session, without a query for the user row.
+    """
+    rates = settings.POLLS_VOTE_THROTTLE
+    if not rates:
+        return 0
+    idents = {
+        'ip': client_ip(request),
+        'user': request.session.get(SESSION_KEY),
+        'question': question_id,
+    }
+    buckets = []
+    for scope, (capacity, period) in rates.items():
+        if scope not in idents:
+            raise ImproperlyConfigured(
+                'Unknown POLLS_VOTE_THROTTLE scope %r.' % scope)
+        if idents[scope] is not None:
+            buckets.append((THROTTLE_KEY % (scope, idents[scope]), capacity,
+                            period))
+    return get_store().take(buckets) if buckets else 0
+
+
+def client_ip(request):
+    """
+    Return the client IP of `request`, None if unknown.
+
+    It is read from the ``request.META`` key named by
+    ``POLLS_THROTTLE_IP_HEADER``. Of a comma separated list such as
+    ``X-Forwarded-For`` the last address is used, the one added by the
+    proxy in front of the application.
+    """
+    value = request.META.get(settings.POLLS_THROTTLE_IP_HEADER)
+    return value and value.split(',')[-1].strip() or None
+
+
+def too_many_votes(wait):
+    """Return the 429 response telling a client to retry in `wait` s."""
+    response = HttpResponse('Too many votes, please try again later.',
+                            status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def throttle_votes(view):
+    """Answer 429 before running a sync or async vote view over the rate."""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, question_id, *args, **kwargs):
+            wait = await sync_to_async(vote_wait)(request, question_id)
+            if wait:
+                return too_many_votes(wait)
+            return await view(request, question_id, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, question_id, *args, **kwargs):
+        wait = vote_wait(request, question_id)
+        if wait:
+            return too_many_votes(wait)
+        return view(request, question_id, *args, **kwargs)
+    return wrapper
@@ -1,14 +1,31 @@
 """Urls link for polls app."""
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import async_views, instrumentation, views
 
-app_name = 'polls'
-urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
-    path('<int:question_id>/', views.polls_check_expire, name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
 
+def build_urlpatterns(use_async_views):
+    """Return the url patterns, with the async read and vote views if set."""
+    index = views.IndexView.as_view()
+    if use_async_views:
+        detail = async_views.polls_check_expire
+        results = async_views.results
+        vote = async_views.vote
+    else:
+        detail = views.polls_check_expire
+        results = views.ResultsView.as_view()
+        vote = views.vote
+    return [
+        path('', index, name='index'),
+        path('<int:question_id>/', detail, name='detail'),
+        path('<int:pk>/results/', results, name='results'),
+        path('<int:question_id>/vote/', vote, name='vote'),
+        path('votes/bulk/', views.bulk_vote, name='bulk_vote'),
+        path('<int:question_id>/export/<slug:kind>.<slug:fmt>',
+             views.export, name='export'),
+        path('_metrics', instrumentation.metrics, name='metrics'),
+    ]
 
 
-]
+app_name = 'polls'
+urlpatterns = build_urlpatterns(settings.POLLS_ASYNC_VIEWS)
@@ -1,21 +1,48 @@
 """The view configuration for Django polls app."""
+import csv
+import io
+import json
 import logging
+from collections import Counter
 from datetime import datetime
 
 from django.contrib.auth import authenticate, login
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
-from django.http import HttpResponseRedirect
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseRedirect, \
+    JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView
 
-from .models import Question, Choice, Vote
+from .buffer import get_buffer
+from .cache import get_question_graph, get_results, index_cache_timeout, \
+    index_page_key, index_version, question_version
+from .export import CONTENT_TYPES, export_chunks
+from .schedule import get_schedule, get_schedule_with
+from .models import Question
+from .routers import use_primary
+from .throttle import throttle_votes
+from .voting import BULK_BATCH_SIZE, cast_vote, cast_votes_bulk, \
+    holds_vote
 
 from django.views import generic
 
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, \
+    permission_required
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_GET, \
+    require_POST
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 
@@ -25,11 +52,87 @@ class IndexView(generic.ListView):
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
 
+    def get(self, request, *args, **kwargs):
+        """
+        Serve the index page, from the page cache for anonymous users.
+
+        Anonymous pages without flash messages are cached until a question
+        changes or the next ``pub_date``/``end_date`` boundary, whichever
+        comes first, so a cached page never offers a closed poll. Pages
+        about to be cached are read from the primary database.
+        """
+        if request.user.is_authenticated or messages.get_messages(request):
+            return super().get(request, *args, **kwargs)
+        key = index_page_key(request.GET.get('after', ''))
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        with use_primary():
+            response = super().get(request, *args, **kwargs)
+            response.render()
+        if response.status_code == 200:
+            cache.set(key, response.content, index_cache_timeout())
+        return response
+
     def get_queryset(self):
-        """Return all last published questions."""
-        return Question.objects.filter(
-            pub_date__lte=timezone.now()
-        ).order_by('-pub_date')[:]
+        """
+        Return one page of the last published questions.
+
+        Pages are keyset paginated over ``(-pub_date, -pk)``: the ``after``
+        parameter holds the position of the last question of the previous
+        page. The ids of the page and whether each question ``is_open``
+        come from the schedule index, so only the page's rows are read, by
+        primary key. The page is only read when the template uses it, so a
+        cached fragment skips it.
+        """
+        after = self.request.GET.get('after')
+        self.position = decode_cursor(after) if after else None
+        return SimpleLazyObject(lambda: self._page()[0])
+
+    def next_cursor(self):
+        """Return the cursor of the next page, or None on the last page."""
+        return self._page()[1]
+
+    def _page(self):
+        """Query the page once, return it with the next page cursor."""
+        if not hasattr(self, '_page_cache'):
+            now = timezone.now()
+            schedule = get_schedule()
+            size = settings.POLLS_INDEX_PAGE_SIZE
+            ids = schedule.published(now, self.position, size + 1)
+            questions = Question.objects.in_bulk(ids[:size])
+            page = [questions[pk] for pk in ids[:size] if pk in questions]
+            for question in page:
+                question.is_open = schedule.is_open(question.pk, now)
+            next_cursor = encode_cursor(page[-1]) \
+                if len(ids) > size and page else None
+            self._page_cache = page, next_cursor
+        return self._page_cache
+
+    def get_context_data(self, **kwargs):
+        """Add what the question list fragment cache is keyed on."""
+        context = super().get_context_data(**kwargs)
+        context['index_version'] = index_version()
+        context['index_cache_timeout'] = index_cache_timeout()
+        return context
+
+
+def encode_cursor(question):
+    """Return the opaque index page cursor positioned after `question`."""
+    position = '%s|%d' % (question.pub_date.isoformat(), question.pk)
+    return urlsafe_base64_encode(position.encode())
+
+
+def decode_cursor(cursor):
+    """Return the ``(pub_date, pk)`` position of a cursor, or raise 404."""
+    try:
+        pub_date, pk = urlsafe_base64_decode(cursor).decode().split('|')
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+    except ValueError:
+        pub_date = None
+    if pub_date is None:
+        raise Http404('Invalid page cursor.')
+    return pub_date, pk
 
 
 class DetailView(generic.DetailView):
@@ -42,42 +145,132 @@ class DetailView(generic.DetailView):
         """Return any questions that aren't published."""
         return Question.objects.filter(pub_date__lte=timezone.now())
 
+    def get_context_data(self, **kwargs):
+        """Add the choices of the question."""
+        context = super().get_context_data(**kwargs)
+        context['choices'] = self.object.choice_set.all()
+        return context
+
+
+def _question_version(kwargs):
+    """Return the version record of the question a URL points to."""
+    return question_version(kwargs.get('pk') or kwargs['question_id'])
+
+
+def results_etag(request, **kwargs):
+    """Return the ETag of a results page, None for unknown questions."""
+    version = _question_version(kwargs)
+    return version and version_etag('results', version)
 
+
+def version_etag(page, version):
+    """Return the ETag of a `page` of the question of a version record."""
+    return '%s-%s' % (page, version['etag'])
+
+
+def is_open(version):
+    """Return whether the question of a version record can be voted now."""
+    return version['pub_date'] <= timezone.now() <= version['end_date']
+
+
+def question_last_modified(request, **kwargs):
+    """Return when the question a URL points to last changed."""
+    version = _question_version(kwargs)
+    return version and version['modified']
+
+
+@method_decorator(condition(etag_func=results_etag,
+                            last_modified_func=question_last_modified),
+                  name='dispatch')
 class ResultsView(generic.DetailView):
     """Class that contains configuration for result page."""
 
-    model = Question
     template_name = 'polls/results.html'
 
+    def get_queryset(self):
+        """Return the questions with the results snapshot of closed ones."""
+        return Question.objects.select_related('snapshot')
+
+    def get_context_data(self, **kwargs):
+        """Add the cached tallies of the choices."""
+        context = super().get_context_data(**kwargs)
+        context['choices'] = get_results(self.object)
+        context['live_results'] = settings.POLLS_ASYNC_VIEWS
+        return context
+
 
 def polls_check_expire(request, question_id):
-    """Check polls mechanism for polls app."""
-    question = Question.objects.get(pk=question_id)
-    if not question.can_vote():
+    """
+    Check polls mechanism for polls app.
+
+    The page is not answered with 304s: its form carries the user's CSRF
+    token, which changes at login.
+    """
+    version = question_version(question_id)
+    if version is None:
+        raise Http404('No question found.')
+    if not is_open(version):
         messages.warning(request,
                          "Poll expired!, please choose another question")
         return redirect('polls:index')
     else:
-        return render(request, 'polls/detail.html', {'question': question, })
+        question, choices = _question_graph(question_id)
+        return render(request, 'polls/detail.html', {
+            'question': question, 'choices': choices})
+
+
+def _question_graph(question_id):
+    """Return the cached question and choices, or raise 404."""
+    graph = get_question_graph(question_id)
+    if graph is None:
+        raise Http404('No question found.')
+    return graph
+
+
+def selected(choices, choice_id):
+    """Return the choice of `choices` a vote form posted, or None."""
+    try:
+        choice_id = int(choice_id)
+    except (TypeError, ValueError):
+        return None
+    return next((choice for choice in choices if choice.pk == choice_id),
+                None)
 
 
+@throttle_votes
 @login_required()
 def vote(request, question_id):
     """
     Vote for each question by using question_id.
+
+    Votes over the ``POLLS_VOTE_THROTTLE`` rates are turned away with a
+    429 first, and submitting the choice the user already holds writes
+    nothing.
     """
 
-    question = get_object_or_404(Question, pk=question_id)
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+    schedule = get_schedule_with(question_id)
+    if question_id not in schedule:
+        raise Http404('No question found.')
+    if not schedule.is_open(question_id):
+        messages.warning(request,
+                         "Poll expired!, please choose another question")
+        return redirect('polls:index')
+    question, choices = _question_graph(question_id)
+    selected_choice = selected(choices, request.POST.get('choice'))
+    if selected_choice is None:
         # Redisplay the question voting form.
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': choices,
             'error_message': "You didn't select a choice.",
         })
     else:
-        Vote.objects.update_or_create(user=request.user, question=question, defaults={'choice': selected_choice})
+        buffer = get_buffer()
+        if buffer is not None:
+            buffer.add(request.user.pk, question.pk, selected_choice.pk)
+        elif not holds_vote(request.user.pk, question.pk,
+                            selected_choice.pk):
+            cast_vote(request.user, question, selected_choice)
         return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
 
         # Always return an HttpResponseRedirect after successfully dealing
@@ -85,6 +278,111 @@ def vote(request, question_id):
         # user hits the Back button.
 
 
+@require_POST
+@permission_required('polls.add_vote', raise_exception=True)
+def bulk_vote(request):
+    """
+    Record many ballots in one request.
+
+    The body is either JSON (a list of ``{"user", "question", "choice"}``
+    objects, or such a list under ``"ballots"``) or CSV with a
+    ``user,question,choice`` header, posted directly or as a ``file``
+    upload. ``user`` is a username. Ballots for questions that cannot be
+    voted on now are refused like in ``vote``. Answer with the outcome of
+    every row.
+    """
+    try:
+        rows = _read_ballot_rows(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    outcomes = ['malformed row'] * len(rows)
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            username = row['user']
+            question_id, choice_id = int(row['question']), int(row['choice'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if username not in (None, ''):
+            parsed.append((index, str(username), question_id, choice_id))
+
+    usernames = list({username for _, username, _, _ in parsed})
+    user_ids = {}
+    for chunk in [usernames[i:i + BULK_BATCH_SIZE]
+                  for i in range(0, len(usernames), BULK_BATCH_SIZE)]:
+        user_ids.update(User.objects.filter(username__in=chunk)
+                        .values_list('username', 'pk'))
+
+    closed = {}
+    ballots, positions = [], []
+    for index, username, question_id, choice_id in parsed:
+        if question_id not in closed:
+            schedule = get_schedule_with(question_id)
+            closed[question_id] = question_id in schedule and \
+                not schedule.is_open(question_id)
+        if closed[question_id]:
+            outcomes[index] = 'closed poll'
+            continue
+        ballots.append((user_ids.get(username), question_id, choice_id))
+        positions.append(index)
+    for index, outcome in zip(positions, cast_votes_bulk(ballots)):
+        outcomes[index] = outcome
+
+    return JsonResponse({
+        'summary': Counter(outcomes),
+        'results': [{'row': index, 'status': outcome}
+                    for index, outcome in enumerate(outcomes)],
+    })
+
+
+def _read_ballot_rows(request):
+    """Return the ballot rows of a bulk request as a list of dicts."""
+    if 'file' in request.FILES:
+        text = request.FILES['file'].read().decode('utf-8')
+        return list(csv.DictReader(io.StringIO(text)))
+    if request.content_type == 'text/csv':
+        return list(csv.DictReader(io.StringIO(request.body.decode())))
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise ValueError('Body must be JSON or CSV.')
+    if isinstance(data, dict):
+        data = data.get('ballots')
+    if not isinstance(data, list) or \
+            not all(isinstance(row, dict) for row in data):
+        raise ValueError('Expected a list of ballot objects.')
+    return data
+
+
+@require_GET
+@permission_required('polls.view_vote', raise_exception=True)
+def export(request, question_id, kind, fmt):
+    """
+    Stream the ``results`` or the ``votes`` of a question as CSV or JSON.
+
+    The export is sent while it is read, in constant memory, and gzipped
+    on the fly when the client accepts it.
+    """
+    if kind not in ('results', 'votes') or fmt not in CONTENT_TYPES:
+        raise Http404('Unknown export.')
+    question = get_object_or_404(Question.objects.select_related('snapshot'),
+                                 pk=question_id)
+    content = export_chunks(question, kind, fmt)
+    gzipped = re_accepts_gzip.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if gzipped:
+        content = compress_sequence(content)
+    response = StreamingHttpResponse(content,
+                                     content_type=CONTENT_TYPES[fmt])
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = 'attachment; filename="%s"' % (
+        'question-%d-%s.%s' % (question.pk, kind, fmt))
+    return response
+
+
 def signup(request):
     """Register a new user."""
     if request.method == 'POST':
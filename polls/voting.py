@@ -0,0 +1,208 @@
+"""Write path for votes in Django polls application."""
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import drop_snapshots, invalidate_results
+from .events import publish_tallies
+from .models import Choice, Vote
+from .sharding import shard_for_question
+from .tallies import get_tallies
+
+# Rows per INSERT/UPDATE statement and ids per IN (...) lookup, small
+# enough for the SQLite host parameter limit.
+BULK_BATCH_SIZE = 500
+
+CREATED = 'created'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+UNKNOWN_USER = 'unknown user'
+INVALID_CHOICE = 'invalid choice'
+
+
+def cast_vote(user, question, choice):
+    """
+    Record the vote of `user` for `choice` and keep the counters in sync.
+
+    The vote is inserted first and the unique constraint on
+    ``(question, user)`` decides whether the user already voted, in which
+    case the existing row is updated instead. This leaves no window for
+    duplicate votes between a read and a write. The vote row and the
+    ``Choice.vote_count`` counters are written in one transaction with
+    ``F()`` expressions, and changing a vote moves one count from the old
+    choice to the new one. Once the transaction commits the cached results
+    of the question are dropped and the change is published to the live
+    results streams. When the votes of the question live on a shard the
+    vote and the counters are written in one transaction on each database.
+    A vote on a closed question drops its results snapshot. Return the
+    ``Vote`` instance.
+    """
+    alias = shard_for_question(question.pk)
+    votes = Vote.objects.using(alias)
+    with _atomic({alias}):
+        try:
+            with transaction.atomic(using=alias):
+                vote = votes.create(user=user, question=question,
+                                    choice=choice)
+        except IntegrityError:
+            vote = votes.select_for_update().get(user=user,
+                                                 question=question)
+            if vote.choice_id != choice.pk:
+                old_choice_id = vote.choice_id
+                votes.filter(pk=vote.pk).update(choice=choice)
+                vote.choice = choice
+                _add_votes(old_choice_id, -1)
+                _add_votes(choice.pk, 1)
+                _on_tally_change(question.pk,
+                                 {old_choice_id: -1, choice.pk: 1})
+        else:
+            _add_votes(choice.pk, 1)
+            _on_tally_change(question.pk, {choice.pk: 1})
+        if question.end_date < timezone.now():
+            drop_snapshots([question.pk])
+    return vote
+
+
+def holds_vote(user_id, question_id, choice_id):
+    """Return whether the user's vote on the question is for `choice_id`."""
+    return Vote.objects.for_question(question_id).filter(
+        user=user_id, choice=choice_id).exists()
+
+
+def cast_votes_bulk(ballots, batch_size=BULK_BATCH_SIZE):
+    """
+    Record many ``(user_id, question_id, choice_id)`` ballots at once.
+
+    Users, choices and existing votes are read with a few chunked queries,
+    new votes are written with ``bulk_create`` and changed ones with
+    ``bulk_update``, all inside one transaction per database. When a user
+    appears more than once for a question the last ballot wins. Return one
+    outcome per ballot: ``CREATED``, ``CHANGED``, ``UNCHANGED``,
+    ``UNKNOWN_USER`` or ``INVALID_CHOICE``.
+    """
+    ballots = list(ballots)
+    try:
+        return _cast_votes_bulk(ballots, batch_size)
+    except IntegrityError:
+        # A single vote inserted a row we planned to create, read again.
+        return _cast_votes_bulk(ballots, batch_size)
+
+
+def _cast_votes_bulk(ballots, batch_size):
+    """Validate and write one batch of ballots, see ``cast_votes_bulk``."""
+    user_ids = {user_id for user_id, _, _ in ballots}
+    choice_ids = {choice_id for _, _, choice_id in ballots}
+    shards = {shard_for_question(question_id)
+              for _, question_id, _ in ballots}
+    with _atomic(shards):
+        known_users = set()
+        for chunk in _chunks(user_ids, batch_size):
+            known_users.update(User.objects.filter(pk__in=chunk)
+                               .values_list('pk', flat=True))
+        choice_question, closed = {}, set()
+        now = timezone.now()
+        for chunk in _chunks(choice_ids, batch_size):
+            for choice_id, question_id, end_date in Choice.objects.filter(
+                    pk__in=chunk).values_list('pk', 'question_id',
+                                              'question__end_date'):
+                choice_question[choice_id] = question_id
+                if end_date < now:
+                    closed.add(question_id)
+        question_shards = defaultdict(set)
+        for question_id in set(choice_question.values()):
+            question_shards[shard_for_question(question_id)].add(question_id)
+        existing = {}
+        for alias, question_ids in question_shards.items():
+            for questions in _chunks(question_ids, batch_size):
+                for users in _chunks(known_users, batch_size):
+                    for vote in Vote.objects.using(alias).filter(
+                            question__in=questions, user__in=users).only(
+                            'pk', 'question_id', 'user_id', 'choice_id'):
+                        existing[vote.user_id, vote.question_id] = vote
+                        choice_question[vote.choice_id] = vote.question_id
+
+        outcomes = []
+        held = {key: vote.choice_id for key, vote in existing.items()}
+        deltas = Counter()
+        for user_id, question_id, choice_id in ballots:
+            if user_id not in known_users:
+                outcomes.append(UNKNOWN_USER)
+                continue
+            if choice_question.get(choice_id) != question_id:
+                outcomes.append(INVALID_CHOICE)
+                continue
+            key = user_id, question_id
+            current = held.get(key)
+            if current == choice_id:
+                outcomes.append(UNCHANGED)
+                continue
+            outcomes.append(CREATED if current is None else CHANGED)
+            if current is not None:
+                deltas[current] -= 1
+            deltas[choice_id] += 1
+            held[key] = choice_id
+
+        created, changed = defaultdict(list), defaultdict(list)
+        for key, choice_id in held.items():
+            vote = existing.get(key)
+            alias = shard_for_question(key[1])
+            if vote is None:
+                created[alias].append(Vote(user_id=key[0], question_id=key[1],
+                                           choice_id=choice_id))
+            elif vote.choice_id != choice_id:
+                vote.choice_id = choice_id
+                changed[alias].append(vote)
+        for alias, votes in created.items():
+            Vote.objects.using(alias).bulk_create(votes,
+                                                  batch_size=batch_size)
+        for alias, votes in changed.items():
+            Vote.objects.using(alias).bulk_update(votes, ['choice'],
+                                                  batch_size=batch_size)
+        question_deltas = {}
+        for choice_id, amount in deltas.items():
+            if amount:
+                _add_votes(choice_id, amount)
+                question_deltas.setdefault(
+                    choice_question[choice_id], {})[choice_id] = amount
+        for question_id, changes in question_deltas.items():
+            _on_tally_change(question_id, changes)
+        if closed.intersection(question_deltas):
+            drop_snapshots(list(closed.intersection(question_deltas)))
+    return outcomes
+
+
+def _atomic(shards):
+    """Return one transaction on the default database and on each shard."""
+    stack = ExitStack()
+    for alias in sorted(shards - {DEFAULT_DB_ALIAS}):
+        stack.enter_context(transaction.atomic(using=alias))
+    stack.enter_context(transaction.atomic())
+    return stack
+
+
+def _chunks(values, size):
+    """Split `values` into lists of at most `size` items."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _add_votes(choice_id, amount):
+    """Atomically add `amount` to the counter of one choice."""
+    Choice.objects.filter(pk=choice_id).update(
+        vote_count=F('vote_count') + amount)
+
+
+def _on_tally_change(question_id, deltas):
+    """Announce changed tallies of a question once the vote commits."""
+    def announce():
+        tallies = get_tallies()
+        if tallies is not None:
+            tallies.add(deltas)
+        invalidate_results(question_id)
+        publish_tallies(question_id, deltas)
+
+    transaction.on_commit(announce)